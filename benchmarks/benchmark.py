@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+"""Throughput benchmark for qcom-nandc-pagify
+
+The page conversion API (Page.program, Page.program_many) and the complete
+CLI are measured for all ECC types, page geometries and widebus settings on
+generated images. The results are saved as JSON and can be compared with a
+baseline of an earlier run.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from qcom_nandc_pagify import EccType, Page  # noqa: E402
+
+GEOMETRIES = [(2048, 64), (2048, 128), (4096, 128), (4096, 256)]
+MODES = ["program", "program_many", "cli"]
+
+# size of the random block which is repeated to generate the images
+PATTERN_SIZE = 1024**2
+
+
+def size_type(sizestr: str) -> int:
+    units = {"k": 1024, "m": 1024**2, "g": 1024**3}
+
+    unit = units.get(sizestr[-1:].lower(), 1)
+    if unit != 1:
+        sizestr = sizestr[:-1]
+
+    return int(sizestr) * unit
+
+
+def generate_image(size: int, seed: int = 1) -> bytes:
+    rand = random.Random(seed)
+    pattern_size = min(size, PATTERN_SIZE)
+    pattern = rand.getrandbits(8 * pattern_size).to_bytes(
+        pattern_size, "little"
+    )
+
+    # the repeated blocks are shifted to avoid identical pages
+    parts = []
+    remaining = size
+    shift = 0
+    while remaining > 0:
+        part = pattern[shift:] + pattern[:shift]
+        parts.append(part[:remaining])
+        remaining -= len(part)
+        shift = (shift + 1) % len(pattern)
+
+    return b"".join(parts)
+
+
+def run_program(page: Page, image: bytes, page_size: int) -> None:
+    view = memoryview(image)
+    for i in range(0, len(image), page_size):
+        page.program(view[i : i + page_size])
+
+
+def run_program_many(page: Page, image: bytes, page_size: int) -> None:
+    batch_size = page_size * 256
+    view = memoryview(image)
+    for i in range(0, len(image), batch_size):
+        page.program_many(view[i : i + batch_size])
+
+
+def measure_api(mode: str, page: Page, image: bytes, page_size: int):
+    run = run_program if mode == "program" else run_program_many
+
+    # build the (lazily created) tables before the measurement
+    run(page, image[:page_size], page_size)
+
+    start = time.perf_counter()
+    run(page, image, page_size)
+    seconds = time.perf_counter() - start
+
+    # second run only for the memory - tracemalloc slows down the conversion
+    tracemalloc.start()
+    run(page, image, page_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return seconds, peak
+
+
+def measure_cli(image_file: str, args: List[str]):
+    with tempfile.TemporaryDirectory() as tmp:
+        outfile = os.path.join(tmp, "out.bin")
+        env = dict(os.environ, PYTHONPATH=SRC_DIR)
+
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "qcom_nandc_pagify",
+                "--infile",
+                image_file,
+                "--outfile",
+                outfile,
+                *args,
+            ],
+            env=env,
+        )
+        # wait4 provides the resource usage of only this process
+        _, status, rusage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+
+    if process.returncode != 0:
+        raise RuntimeError(f"CLI failed with {process.returncode}")
+
+    # maximum resident set size is reported in KiB on Linux
+    peak = rusage.ru_maxrss * 1024
+    if sys.platform == "darwin":
+        peak = rusage.ru_maxrss
+
+    return seconds, peak
+
+
+def result_key(result: Dict[str, Any]) -> str:
+    return (
+        f"{result['mode']}/{result['ecc']}/{result['page_size']}+"
+        f"{result['oob_size']}/widebus={result['widebus']}/"
+        f"{result['image_size']}"
+    )
+
+
+def run_benchmarks(
+    sizes: List[int],
+    modes: List[str],
+    ecc_types: List[EccType],
+    cli_args: List[str],
+) -> List[Dict[str, Any]]:
+    results = []
+
+    for size in sizes:
+        image = generate_image(size)
+
+        with tempfile.NamedTemporaryFile(suffix=".bin") as image_file:
+            image_file.write(image)
+            image_file.flush()
+
+            combinations = itertools.product(
+                modes, ecc_types, GEOMETRIES, [False, True]
+            )
+            for mode, ecc, (page_size, oob_size), widebus in combinations:
+                try:
+                    page = Page(page_size, oob_size, widebus=widebus, ecc=ecc)
+                except ValueError:
+                    # ECC doesn't fit in the OOB area
+                    continue
+
+                if mode == "cli":
+                    args = [
+                        "--pagesize",
+                        str(page_size),
+                        "--oobsize",
+                        str(oob_size),
+                        "--ecc",
+                        ecc.name.lower(),
+                        *(["--widebus"] if widebus else []),
+                        *cli_args,
+                    ]
+                    seconds, peak = measure_cli(image_file.name, args)
+                else:
+                    seconds, peak = measure_api(mode, page, image, page_size)
+
+                pages = math.ceil(size / page_size)
+                result = {
+                    "mode": mode,
+                    "ecc": ecc.name,
+                    "page_size": page_size,
+                    "oob_size": oob_size,
+                    "widebus": widebus,
+                    "image_size": size,
+                    "seconds": seconds,
+                    "mb_per_s": size / 1024**2 / seconds,
+                    "pages_per_s": pages / seconds,
+                    "peak_memory": peak,
+                }
+                results.append(result)
+
+                print(
+                    f"{result_key(result)}: {result['mb_per_s']:.2f} MB/s, "
+                    f"{result['pages_per_s']:.0f} pages/s, "
+                    f"peak {peak / 1024**2:.1f} MB",
+                    file=sys.stderr,
+                )
+
+    return results
+
+
+def compare(
+    results: List[Dict[str, Any]],
+    baseline: Dict[str, Any],
+    tolerance: float,
+) -> List[str]:
+    """Get all results which are slower than their baseline"""
+    baseline_results = {
+        result_key(result): result for result in baseline["results"]
+    }
+
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        reference = baseline_results.get(key)
+        if reference is None:
+            continue
+
+        ratio = result["mb_per_s"] / reference["mb_per_s"]
+        if ratio < 1 - tolerance:
+            regressions.append(
+                f"{key}: {result['mb_per_s']:.2f} MB/s "
+                f"(baseline {reference['mb_per_s']:.2f} MB/s, "
+                f"{(ratio - 1) * 100:+.1f}%)"
+            )
+
+    return regressions
+
+
+def parser() -> argparse.ArgumentParser:
+    parser_def = argparse.ArgumentParser(description=__doc__)
+
+    parser_def.add_argument(
+        "--sizes",
+        default="1M",
+        help="Comma separated list of image sizes (K, M, G suffixes) "
+        "(default: 1M)",
+    )
+    parser_def.add_argument(
+        "--modes",
+        default=",".join(MODES),
+        help=f"Comma separated list of benchmarks (default: {','.join(MODES)})",
+    )
+    parser_def.add_argument(
+        "--ecc",
+        default=",".join(ecc.name.lower() for ecc in EccType),
+        help="Comma separated list of ECC types (default: all)",
+    )
+    parser_def.add_argument(
+        "--cli-args",
+        default="",
+        help="Additional arguments for the CLI benchmark (e.g. '--jobs 4')",
+    )
+    parser_def.add_argument(
+        "--output",
+        default=None,
+        help="Save results as JSON to this file",
+    )
+    parser_def.add_argument(
+        "--baseline",
+        default=None,
+        help="Compare results with the JSON results of an earlier run",
+    )
+    parser_def.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Allowed slowdown compared to the baseline (default: 0.1)",
+    )
+    return parser_def
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parsed_args = parser().parse_args(args)
+
+    sizes = [size_type(size) for size in parsed_args.sizes.split(",")]
+    modes = parsed_args.modes.split(",")
+    ecc_types = [EccType[ecc.upper()] for ecc in parsed_args.ecc.split(",")]
+
+    results = run_benchmarks(
+        sizes, modes, ecc_types, parsed_args.cli_args.split()
+    )
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+
+    if parsed_args.output is not None:
+        with open(parsed_args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+            output.write("\n")
+
+    if parsed_args.baseline is None:
+        return
+
+    with open(parsed_args.baseline, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = compare(results, baseline, parsed_args.tolerance)
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
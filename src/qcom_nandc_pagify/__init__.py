@@ -1,12 +1,65 @@
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
 
-from .chunk import *
-from .ecc import *
-from .page import *
-
-__all__ = [
-    *ecc.__all__,
-    *chunk.__all__,
-    *page.__all__,
-]
+import importlib
+
+# public names of the submodules (their __all__) - the submodules are only
+# imported on first access
+_exports = {
+    "ecc": ["EccBch", "EccRs", "EccType"],
+    "aio": ["pagify_stream"],
+    "backend": [
+        "EccBackend",
+        "available_backends",
+        "calibrate_backends",
+        "calibrated_backend",
+        "create_codec",
+        "default_calibration_file",
+        "get_backend",
+        "load_calibration",
+        "register_backend",
+        "registered_backends",
+    ],
+    "cache": ["EccCache", "EccDiskCache"],
+    "chunk": ["Chunk"],
+    "convert": [
+        "PageConfig",
+        "PagifySummary",
+        "VerifySummary",
+        "depagify",
+        "pad_erased",
+        "pagify",
+        "pagify_incremental",
+        "pagify_mmap",
+        "pagify_pipeline",
+        "pagify_range",
+        "verify",
+    ],
+    "geometry": ["NandLocation", "PageGeometry"],
+    "index": ["PageIndex"],
+    "layout": ["PageLayout"],
+    "page": ["Page"],
+    "stats": ["ConversionStats", "StageHook", "StageStats"],
+    "stream": ["PagifyReader", "PagifyWriter", "iter_pages"],
+}
+
+_export_modules = {
+    name: module for module, names in _exports.items() for name in names
+}
+
+__all__ = [name for names in _exports.values() for name in names]
+
+
+def __getattr__(name):
+    module = _export_modules.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *__all__])
@@ -0,0 +1,77 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import importlib
+import importlib.util
+import threading
+from typing import Any, Optional
+
+# serializes the import of the lazy modules
+_IMPORT_LOCK = threading.Lock()
+
+
+class LazyModule:
+    """Module which is only imported on the first attribute access"""
+
+    def __init__(self, name: str) -> None:
+        self.__name = name
+        self.__module = None
+        self.__error: Optional[str] = None
+
+    def __load(self) -> Any:
+        module = self.__module
+        if module is None:
+            with _IMPORT_LOCK:
+                # a failed import is not retried - a new exception is raised
+                # to avoid the growing traceback of a re-raised one
+                if self.__error is not None:
+                    raise ImportError(self.__error, name=self.__name) from None
+
+                if self.__module is None:
+                    try:
+                        self.__module = importlib.import_module(self.__name)
+                    except ImportError as exc:
+                        self.__error = str(exc)
+                        raise
+
+                module = self.__module
+
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.__load(), attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self.__name!r}>"
+
+
+def optional_module(name: str) -> Optional[LazyModule]:
+    """Lazy module or None when the module is not installed
+
+    Only the module's spec is searched. It is neither imported nor executed
+    until one of its attributes is used - use available() to check whether
+    it can really be imported.
+    """
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+
+    if spec is None:
+        return None
+
+    return LazyModule(name)
+
+
+def available(module: Optional[LazyModule]) -> bool:
+    """Import an optional module; False when it is missing or broken"""
+    if module is None:
+        return False
+
+    try:
+        # any attribute access imports the module
+        module.__name__  # noqa: B018
+    except ImportError:
+        return False
+
+    return True
@@ -2,9 +2,38 @@
 # SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
 
 import argparse
-from typing import List, Optional
+import math
+import os
+import stat
+import sys
+from typing import BinaryIO, Dict, List, Optional
 
-from . import EccType, Page
+from ._lazy import LazyModule
+from .backend import (
+    available_backends,
+    calibrate_backends,
+    calibrated_backend,
+    create_codec,
+    default_calibration_file,
+    registered_backends,
+)
+from .convert import (
+    PageConfig,
+    PagifySummary,
+    depagify,
+    pad_erased,
+    pagify,
+    pagify_incremental,
+    pagify_mmap,
+    pagify_pipeline,
+    pagify_range,
+    verify,
+)
+from .ecc import EccType
+from .stats import ConversionStats
+
+# only needed for --profile
+cProfile = LazyModule("cProfile")
 
 
 def ecc_type(astring: str) -> EccType:
@@ -32,20 +61,81 @@ def positive_int_type(intstr: str) -> int:
     return intval
 
 
+def non_negative_int_type(intstr: str) -> int:
+    intval = int(intstr)
+
+    if intval < 0:
+        raise argparse.ArgumentTypeError("Must not be negative")
+
+    return intval
+
+
+def size_type(sizestr: str) -> int:
+    units = {
+        "k": 1024,
+        "m": 1024**2,
+        "g": 1024**3,
+        "t": 1024**4,
+    }
+
+    unit = units.get(sizestr[-1:].lower(), 1)
+    if unit != 1:
+        sizestr = sizestr[:-1]
+
+    try:
+        intval = int(sizestr, 0) * unit
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"Invalid size {sizestr}") from exc
+
+    if intval <= 0:
+        raise argparse.ArgumentTypeError("Must be larger than 0")
+
+    return intval
+
+
+def open_file(
+    main_parser: argparse.ArgumentParser, path: str, mode: str
+) -> BinaryIO:
+    if path != "-":
+        try:
+            return open(path, mode)
+        except OSError as exc:
+            main_parser.error(f"can't open '{path}': {exc}")
+
+    if "r" in mode:
+        return open(sys.stdin.fileno(), mode, closefd=False)
+
+    return open(sys.stdout.fileno(), mode, closefd=False)
+
+
 def parser() -> argparse.ArgumentParser:
     parser_def = argparse.ArgumentParser()
 
     parser_def.add_argument(
         "--infile",
-        type=argparse.FileType("rb"),
-        required=True,
-        help="Raw image file",
+        default=None,
+        help="Raw image file (or image in qcom,nandc page format for "
+        "--depagify and --verify)",
     )
     parser_def.add_argument(
         "--outfile",
-        type=argparse.FileType("wb"),
-        required=True,
-        help="Output file for image in qcom,nandc page format",
+        default=None,
+        help="Output file for image in qcom,nandc page format (or raw image "
+        "for --depagify, corrected image for --verify)",
+    )
+    mode = parser_def.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--depagify",
+        action="store_true",
+        default=False,
+        help="Extract the raw image from an image in qcom,nandc page format",
+    )
+    mode.add_argument(
+        "--verify",
+        action="store_true",
+        default=False,
+        help="Check (and correct) the ECC of an image in qcom,nandc page "
+        "format",
     )
     parser_def.add_argument(
         "--pagesize",
@@ -66,35 +156,572 @@ def parser() -> argparse.ArgumentParser:
         help="ECC method used for each chunk [bch4, bch8, rs, rs_sbl] "
         "(default: bch4)",
     )
+    parser_def.add_argument(
+        "--ecc-backend",
+        # the availability is only checked when a backend is selected
+        choices=registered_backends(),
+        default=None,
+        help="Implementation used for the ECC calculation (default: the "
+        "calibrated backend)",
+    )
+    parser_def.add_argument(
+        "--calibrate",
+        action="store_true",
+        default=False,
+        help="Measure the available ECC backends and save the fastest one "
+        "for each ECC method",
+    )
     parser_def.add_argument(
         "--widebus",
         action="store_true",
         default=False,
         help="Enable 16x wide bus support",
     )
+    parser_def.add_argument(
+        "--erased-pages",
+        choices=["encode", "skip"],
+        default="encode",
+        help="Handling of all-0xff input pages: encode them with ECC or "
+        "skip the ECC and write them as erased pages (default: encode)",
+    )
+    parser_def.add_argument(
+        "--ecc-cache-size",
+        type=positive_int_type,
+        default=None,
+        help="Cache the ECC of up to this number of different chunks",
+    )
+    parser_def.add_argument(
+        "--ecc-cache-file",
+        default=None,
+        help="SQLite file to persistently cache the ECC of chunks (only for "
+        "the table and bchlib backends)",
+    )
+    parser_def.add_argument(
+        "--ecc-cache-file-size",
+        type=positive_int_type,
+        default=1000000,
+        help="Maximum number of chunks in the ECC cache file "
+        "(default: 1000000)",
+    )
+    parser_def.add_argument(
+        "--jobs",
+        type=positive_int_type,
+        default=1,
+        help="Number of worker processes used for the conversion (default: 1)",
+    )
+    parser_def.add_argument(
+        "--threads",
+        action="store_true",
+        default=False,
+        help="Use worker threads instead of worker processes for --jobs",
+    )
+    parser_def.add_argument(
+        "--pad-to",
+        "--flash-size",
+        dest="pad_to",
+        type=size_type,
+        default=None,
+        help="Pad the output with erased pages to this size of the NAND "
+        "(without OOB). Supports the suffixes K, M, G and T",
+    )
+    parser_def.add_argument(
+        "--pad-mode",
+        choices=["fill", "sparse"],
+        default="fill",
+        help="Write the erased pages for padding (fill) or only extend the "
+        "file with holes (sparse) (default: fill)",
+    )
+    parser_def.add_argument(
+        "--summary",
+        action="store_true",
+        default=False,
+        help="Print a summary of the conversion to stderr",
+    )
+    parser_def.add_argument(
+        "--mmap",
+        action="store_true",
+        default=False,
+        help="Use memory mapped input and output files",
+    )
+    parser_def.add_argument(
+        "--pipeline",
+        action="store_true",
+        default=False,
+        help="Read, convert and write in separate threads to overlap I/O with "
+        "the ECC calculation",
+    )
+    parser_def.add_argument(
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="Only convert the pages which changed since the last conversion "
+        "to the same output file",
+    )
+    parser_def.add_argument(
+        "--index-file",
+        default=None,
+        help="Sidecar file with the digests of all input pages for "
+        "--incremental (default: OUTFILE.idx)",
+    )
+    parser_def.add_argument(
+        "--start-page",
+        type=non_negative_int_type,
+        default=None,
+        help="Only convert the pages starting at this page and write them at "
+        "their position in the existing output file",
+    )
+    parser_def.add_argument(
+        "--count",
+        type=positive_int_type,
+        default=None,
+        help="Number of pages converted with --start-page (default: all "
+        "remaining pages)",
+    )
+    parser_def.add_argument(
+        "--stats",
+        action="store_true",
+        default=False,
+        help="Print the time, calls and bytes of the read, encode, layout and "
+        "write stages of the conversion to stderr",
+    )
+    parser_def.add_argument(
+        "--profile",
+        default=None,
+        metavar="FILE",
+        help="Save cProfile statistics (pstats format) of the run to FILE",
+    )
     return parser_def
 
 
-def main(args: Optional[List[str]] = None) -> None:
-    main_parser = parser()
-    parsed_args = main_parser.parse_args(args)
+def file_stat(path: str, stdio) -> os.stat_result:
+    if path == "-":
+        return os.fstat(stdio.fileno())
+
+    return os.stat(path)
+
+
+def check_padding(
+    main_parser: argparse.ArgumentParser,
+    parsed_args: argparse.Namespace,
+    config: PageConfig,
+) -> None:
+    """Check the --pad-to parameters before anything is converted"""
+    if parsed_args.pad_to is None:
+        return
+
+    # the size of pipes is only known after the conversion
+    in_stat = file_stat(parsed_args.infile, sys.stdin)
+    if stat.S_ISREG(in_stat.st_mode):
+        pad_pages = math.ceil(parsed_args.pad_to / config.page_size)
+        if math.ceil(in_stat.st_size / config.page_size) > pad_pages:
+            main_parser.error("Input image larger than padded size")
+
+    if parsed_args.pad_mode == "sparse" and parsed_args.outfile == "-":
+        out_stat = file_stat(parsed_args.outfile, sys.stdout)
+        if not stat.S_ISREG(out_stat.st_mode):
+            main_parser.error("Sparse padding requires a regular output file")
+
+
+def pad_output(
+    main_parser: argparse.ArgumentParser,
+    parsed_args: argparse.Namespace,
+    config: PageConfig,
+    summary: PagifySummary,
+    data_out: BinaryIO,
+) -> None:
+    if parsed_args.pad_to is None:
+        return
+
+    pad_pages = math.ceil(parsed_args.pad_to / config.page_size)
+    if summary.pages > pad_pages:
+        main_parser.error("Input image larger than padded size")
+
+    sparse = parsed_args.pad_mode == "sparse"
+    if sparse and not data_out.seekable():
+        main_parser.error("Sparse padding requires a regular output file")
+
+    pad_erased(data_out, config, pad_pages - summary.pages, sparse=sparse)
+
+
+def reject_options(
+    main_parser: argparse.ArgumentParser,
+    mode: str,
+    options: Dict[str, bool],
+) -> None:
+    """Report the first used option which is not supported by the mode"""
+    for option, used in options.items():
+        if used:
+            main_parser.error(f"{mode} cannot be used with {option}")
+
+
+def convert_window(
+    main_parser: argparse.ArgumentParser,
+    parsed_args: argparse.Namespace,
+    config: PageConfig,
+) -> None:
+    if "-" in (parsed_args.infile, parsed_args.outfile):
+        main_parser.error("--start-page cannot be used with stdin/stdout")
+
+    reject_options(
+        main_parser,
+        "--start-page",
+        {
+            "--incremental": parsed_args.incremental,
+            "--mmap": parsed_args.mmap,
+            "--pipeline": parsed_args.pipeline,
+            "--pad-to": parsed_args.pad_to is not None,
+        },
+    )
+
+    # the other pages of an existing output file must be kept
+    out_mode = "r+b" if os.path.exists(parsed_args.outfile) else "w+b"
+
+    with open_file(
+        main_parser, parsed_args.infile, "rb"
+    ) as data_in, open_file(
+        main_parser, parsed_args.outfile, out_mode
+    ) as data_out:
+        summary = pagify_range(
+            data_in,
+            data_out,
+            config,
+            parsed_args.start_page,
+            parsed_args.count,
+            jobs=parsed_args.jobs,
+            threads=parsed_args.threads,
+        )
+
+    if parsed_args.summary:
+        print_summary(summary)
+        print_cache(summary)
+
+
+def print_cache(summary: PagifySummary) -> None:
+    lookups = summary.ecc_cache_hits + summary.ecc_cache_misses
+    if lookups == 0:
+        return
+
+    print(
+        f"ECC cache: {summary.ecc_cache_hits} hits, "
+        f"{summary.ecc_cache_misses} misses "
+        f"({summary.ecc_cache_hits / lookups * 100:.1f}% hit rate)",
+        file=sys.stderr,
+    )
+
+
+def print_summary(summary: PagifySummary) -> None:
+    print(
+        f"pages: {summary.pages}, encoded pages: {summary.encoded_pages}, "
+        f"repeated page runs: {summary.runs} "
+        f"({summary.repeated_pages} pages)",
+        file=sys.stderr,
+    )
+
+
+def print_stats(stats: ConversionStats, summary: PagifySummary) -> None:
+    for line in stats.format(summary.pages):
+        print(line, file=sys.stderr)
+
+
+def verify_image(
+    main_parser: argparse.ArgumentParser,
+    parsed_args: argparse.Namespace,
+    config: PageConfig,
+) -> None:
+    with open_file(main_parser, parsed_args.infile, "rb") as data_in:
+        try:
+            if parsed_args.outfile is None:
+                summary = verify(data_in, config, jobs=parsed_args.jobs)
+            else:
+                with open_file(
+                    main_parser, parsed_args.outfile, "wb"
+                ) as data_out:
+                    summary = verify(
+                        data_in, config, data_out, jobs=parsed_args.jobs
+                    )
+        except (ImportError, ValueError) as exc:
+            # truncated NAND images or missing numpy
+            main_parser.error(str(exc))
+
+    for page, chunk, bitflips in summary.errors:
+        if bitflips < 0:
+            result = "uncorrectable"
+        else:
+            result = f"{bitflips} bitflips corrected"
+
+        print(f"page {page} chunk {chunk}: {result}", file=sys.stderr)
+
+    print(
+        f"pages: {summary.pages}, chunks: {summary.chunks}, "
+        f"corrected chunks: {summary.corrected_chunks} "
+        f"({summary.bitflips} bitflips), "
+        f"uncorrectable chunks: {summary.uncorrectable_chunks}",
+        file=sys.stderr,
+    )
+
+    if summary.uncorrectable_chunks > 0:
+        sys.exit(1)
 
-    data_in = parsed_args.infile
-    data_out = parsed_args.outfile
 
-    page = Page(
+def calibrate() -> None:
+    path = default_calibration_file()
+    results = calibrate_backends(path)
+
+    for ecc, timings in results.items():
+        fastest = min(timings, key=timings.get)
+        for backend, seconds in sorted(timings.items(), key=lambda x: x[1]):
+            mark = " (selected)" if backend == fastest else ""
+            print(f"{ecc} {backend}: {seconds * 1000:.2f} ms{mark}")
+
+    print(f"Saved to {path}")
+
+
+def run(
+    main_parser: argparse.ArgumentParser, parsed_args: argparse.Namespace
+) -> None:
+    # only the command line tool uses the result of --calibrate implicitly
+    ecc_backend = parsed_args.ecc_backend
+    if ecc_backend is None:
+        ecc_backend = calibrated_backend(parsed_args.ecc)
+    elif ecc_backend not in available_backends(parsed_args.ecc):
+        main_parser.error(
+            f"ECC backend {ecc_backend} is not available for "
+            f"{parsed_args.ecc.name}"
+        )
+
+    config = PageConfig(
         page_size=parsed_args.pagesize,
         oob_size=parsed_args.oobsize,
         widebus=parsed_args.widebus,
         ecc=parsed_args.ecc,
+        skip_erased=parsed_args.erased_pages == "skip",
+        ecc_cache_size=parsed_args.ecc_cache_size or 0,
+        ecc_cache_file=parsed_args.ecc_cache_file,
+        ecc_cache_file_size=parsed_args.ecc_cache_file_size,
+        ecc_backend=ecc_backend,
     )
 
-    # process input as "page_size" byte pages (+ necessary padding) and write
-    # it to as "page_size + oob_size" pages
-    while data_in:
-        data = data_in.read(parsed_args.pagesize)
-        if len(data) == 0:
-            break
+    if parsed_args.calibrate:
+        calibrate()
+        return
+
+    # the lookup would cost more than the batch calculation - so the batch
+    # encoders never use the cache file
+    if (
+        parsed_args.ecc_cache_file is not None
+        and create_codec(parsed_args.ecc, ecc_backend).batch
+    ):
+        main_parser.error(
+            "--ecc-cache-file is not used by the numpy batch encoder - "
+            "select --ecc-backend table or bchlib"
+        )
+
+    if parsed_args.infile is None:
+        main_parser.error("the following arguments are required: --infile")
+
+    # report unreadable input files before anything is written
+    if parsed_args.infile != "-":
+        open_file(main_parser, parsed_args.infile, "rb").close()
+
+    stats = None
+    if parsed_args.stats:
+        if parsed_args.start_page is not None:
+            main_parser.error("--stats cannot be used with --start-page")
+
+        reject_options(
+            main_parser,
+            "--stats",
+            {
+                "--depagify": parsed_args.depagify,
+                "--verify": parsed_args.verify,
+                "--incremental": parsed_args.incremental,
+                "--mmap": parsed_args.mmap,
+            },
+        )
+
+        stats = ConversionStats()
+
+    if parsed_args.verify:
+        reject_options(
+            main_parser,
+            "--verify",
+            {
+                "--depagify": parsed_args.depagify,
+                "--start-page": parsed_args.start_page is not None,
+                "--count": parsed_args.count is not None,
+                "--incremental": parsed_args.incremental,
+                "--mmap": parsed_args.mmap,
+                "--pipeline": parsed_args.pipeline,
+                "--pad-to": parsed_args.pad_to is not None,
+                "--threads": parsed_args.threads,
+            },
+        )
+
+        verify_image(main_parser, parsed_args, config)
+        return
+
+    if parsed_args.depagify:
+        reject_options(
+            main_parser,
+            "--depagify",
+            {
+                "--start-page": parsed_args.start_page is not None,
+                "--count": parsed_args.count is not None,
+                "--jobs": parsed_args.jobs > 1,
+                "--threads": parsed_args.threads,
+                "--incremental": parsed_args.incremental,
+                "--mmap": parsed_args.mmap,
+                "--pipeline": parsed_args.pipeline,
+                "--pad-to": parsed_args.pad_to is not None,
+            },
+        )
+
+    if parsed_args.outfile is None:
+        main_parser.error("the following arguments are required: --outfile")
+
+    if parsed_args.count is not None and parsed_args.start_page is None:
+        main_parser.error("--count requires --start-page")
+
+    if parsed_args.start_page is not None:
+        convert_window(main_parser, parsed_args, config)
+        return
+
+    if parsed_args.depagify:
+        with open_file(
+            main_parser, parsed_args.infile, "rb"
+        ) as data_in, open_file(
+            main_parser, parsed_args.outfile, "wb"
+        ) as data_out:
+            try:
+                depagify(data_in, data_out, config)
+            except ValueError as exc:
+                # truncated NAND images
+                main_parser.error(str(exc))
+        return
+
+    check_padding(main_parser, parsed_args, config)
+
+    if parsed_args.incremental:
+        if "-" in (parsed_args.infile, parsed_args.outfile):
+            main_parser.error("--incremental cannot be used with stdin/stdout")
+
+        reject_options(
+            main_parser,
+            "--incremental",
+            {
+                "--mmap": parsed_args.mmap,
+                "--pipeline": parsed_args.pipeline,
+                "--jobs": parsed_args.jobs > 1,
+                "--threads": parsed_args.threads,
+            },
+        )
+
+        pad_pages = None
+        if parsed_args.pad_to is not None:
+            pad_pages = math.ceil(parsed_args.pad_to / config.page_size)
+
+        # the input size was already checked against pad_pages
+        summary = pagify_incremental(
+            parsed_args.infile,
+            parsed_args.outfile,
+            config,
+            index_file=parsed_args.index_file,
+            pad_pages=pad_pages,
+            sparse=parsed_args.pad_mode == "sparse",
+        )
+    elif parsed_args.mmap:
+        if "-" in (parsed_args.infile, parsed_args.outfile):
+            main_parser.error("--mmap cannot be used with stdin/stdout")
+
+        reject_options(
+            main_parser,
+            "--mmap",
+            {
+                "--pipeline": parsed_args.pipeline,
+                "--threads": parsed_args.threads,
+            },
+        )
+
+        summary = pagify_mmap(
+            parsed_args.infile,
+            parsed_args.outfile,
+            config,
+            jobs=parsed_args.jobs,
+        )
+
+        with open(parsed_args.outfile, "r+b") as data_out:
+            data_out.seek(0, os.SEEK_END)
+            pad_output(main_parser, parsed_args, config, summary, data_out)
+    elif parsed_args.pipeline:
+        reject_options(
+            main_parser,
+            "--pipeline",
+            {
+                "--jobs": parsed_args.jobs > 1,
+                "--threads": parsed_args.threads,
+            },
+        )
+
+        with open_file(
+            main_parser, parsed_args.infile, "rb"
+        ) as data_in, open_file(
+            main_parser, parsed_args.outfile, "wb"
+        ) as data_out:
+            if stats is not None:
+                stats.start()
+
+            summary = pagify_pipeline(
+                data_in, data_out, config, stats_hook=stats
+            )
+            if stats is not None:
+                stats.stop()
+
+            pad_output(main_parser, parsed_args, config, summary, data_out)
+    else:
+        with open_file(
+            main_parser, parsed_args.infile, "rb"
+        ) as data_in, open_file(
+            main_parser, parsed_args.outfile, "wb"
+        ) as data_out:
+            if stats is not None:
+                stats.start()
+
+            summary = pagify(
+                data_in,
+                data_out,
+                config,
+                jobs=parsed_args.jobs,
+                threads=parsed_args.threads,
+                stats_hook=stats,
+            )
+            if stats is not None:
+                stats.stop()
+
+            pad_output(main_parser, parsed_args, config, summary, data_out)
+
+    if parsed_args.summary:
+        print_summary(summary)
+
+    if stats is not None:
+        print_stats(stats, summary)
+
+    if parsed_args.summary or stats is not None:
+        print_cache(summary)
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    main_parser = parser()
+    parsed_args = main_parser.parse_args(args)
+
+    if parsed_args.profile is None:
+        run(main_parser, parsed_args)
+        return
 
-        page.program(data)
-        data_out.write(page.data)
+    # only the main process is profiled - not the workers of --jobs
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        run(main_parser, parsed_args)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(parsed_args.profile)
@@ -0,0 +1,118 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import math
+from typing import Optional
+
+from .convert import (
+    BATCH_PAGES,
+    PageConfig,
+    PagifySummary,
+    _process_program,
+)
+
+__all__ = [
+    "pagify_stream",
+]
+
+
+async def _read_batch(reader: asyncio.StreamReader, size: int) -> bytes:
+    # StreamReader.read() returns what is available - collect a full batch
+    data = bytearray()
+    while len(data) < size:
+        block = await reader.read(size - len(data))
+        if not block:
+            break
+
+        data += block
+
+    return bytes(data)
+
+
+async def pagify_stream(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    config: PageConfig,
+    executor: Optional[concurrent.futures.Executor] = None,
+    jobs: int = 1,
+    batch_pages: int = BATCH_PAGES,
+) -> PagifySummary:
+    """Convert a raw image from an asyncio stream to qcom,nandc pages
+
+    The batches of pages are converted in an executor and written in order.
+    At most 2 * jobs batches are in flight and the writer is drained after
+    each batch. Without an executor, the loop's default executor is used for
+    jobs == 1 and a pool of jobs worker processes otherwise. An executor can
+    also be shared between multiple conversions.
+
+    The threads of an executor share a page converter which is closed at the
+    end of the conversion. Worker processes keep their page converter until
+    the process pool is shut down.
+    """
+    loop = asyncio.get_running_loop()
+
+    # check configuration before any batch is submitted - without blocking
+    # the event loop when an ECC backend has to be imported
+    await loop.run_in_executor(None, config.validate)
+
+    summary = PagifySummary()
+    batch_size = config.page_size * batch_pages
+
+    own_executor = None
+    if executor is None and jobs > 1:
+        own_executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        executor = own_executor
+
+    # limit the number of batches which are read but not yet written
+    max_in_flight = 2 * jobs
+    in_flight = collections.deque()
+
+    async def write_oldest() -> None:
+        nand_pages = await in_flight.popleft()
+        writer.write(nand_pages)
+        await writer.drain()
+
+    # the page converter of executor threads is shared and closed at the end
+    page = None
+    try:
+        if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            program = functools.partial(_process_program, config)
+        else:
+            page = await loop.run_in_executor(None, config.create_page)
+            program = page.program_many
+
+        while True:
+            data = await _read_batch(reader, batch_size)
+            if len(data) == 0:
+                break
+
+            page_count = math.ceil(len(data) / config.page_size)
+            summary.pages += page_count
+            summary.encoded_pages += page_count
+
+            future = loop.run_in_executor(executor, program, data)
+            in_flight.append(future)
+
+            if len(in_flight) >= max_in_flight:
+                await write_oldest()
+
+        while in_flight:
+            await write_oldest()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+        # retrieve the results of batches which finished before the error
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+        if page is not None:
+            page.close()
+
+        if own_executor is not None:
+            await loop.run_in_executor(None, own_executor.shutdown)
+
+    return summary
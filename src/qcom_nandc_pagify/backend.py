@@ -0,0 +1,290 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import json
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, List, Optional
+
+from . import ecc as _ecc
+from ._lazy import available, optional_module
+from .chunk import Chunk
+from .ecc import EccBch, EccMeta, EccRs, EccType
+
+np = optional_module("numpy")
+
+__all__ = [
+    "EccBackend",
+    "available_backends",
+    "calibrate_backends",
+    "calibrated_backend",
+    "create_codec",
+    "default_calibration_file",
+    "get_backend",
+    "load_calibration",
+    "register_backend",
+    "registered_backends",
+]
+
+
+@dataclass(frozen=True)
+class EccBackend:
+    name: str
+    # ECC types which can be encoded by this backend
+    ecc_types: FrozenSet[EccType]
+    # whether encode_many() is faster than a loop over encode()
+    batch: bool
+    # create codec for an ECC type
+    factory: Callable[[EccType], EccMeta]
+    # check whether the necessary modules are installed
+    available: Callable[[], bool] = lambda: True
+
+
+_backends: Dict[str, EccBackend] = {}
+
+_RS_TYPES = frozenset([EccType.RS, EccType.RS_SBL])
+_BCH_TYPES = frozenset([EccType.BCH4, EccType.BCH8])
+
+
+def register_backend(backend: EccBackend) -> None:
+    """Add (or replace) an ECC backend in the registry"""
+    _backends[backend.name] = backend
+
+
+def get_backend(name: str, ecc: Optional[EccType] = None) -> EccBackend:
+    """Get a registered backend (which can be used for an ECC type)"""
+    backend = _backends.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown ECC backend {name}")
+
+    if ecc is None:
+        return backend
+
+    if ecc not in backend.ecc_types:
+        raise ValueError(f"ECC backend {name} doesn't support {ecc.name}")
+
+    if not backend.available():
+        raise ImportError(f"ECC backend {name} is not available")
+
+    return backend
+
+
+def registered_backends() -> List[str]:
+    """Names of all backends - also the ones which are not available"""
+    return list(_backends)
+
+
+def available_backends(ecc: Optional[EccType] = None) -> List[str]:
+    """Names of all usable backends (for an ECC type)"""
+    return [
+        backend.name
+        for backend in _backends.values()
+        if (ecc is None or ecc in backend.ecc_types) and backend.available()
+    ]
+
+
+def _bch_bits(ecc: EccType) -> int:
+    if ecc == EccType.BCH4:
+        return 4
+
+    return 8
+
+
+def _table_codec(ecc: EccType) -> EccMeta:
+    if ecc in _RS_TYPES:
+        return EccRs(use_numpy=False)
+
+    return EccBch(_bch_bits(ecc), use_bchlib=False, use_numpy=False)
+
+
+def _bchlib_codec(ecc: EccType) -> EccMeta:
+    return EccBch(_bch_bits(ecc), use_bchlib=True, use_numpy=False)
+
+
+def _numpy_codec(ecc: EccType) -> EccMeta:
+    if ecc in _RS_TYPES:
+        return EccRs(use_numpy=True)
+
+    return EccBch(_bch_bits(ecc), use_numpy=True)
+
+
+register_backend(
+    EccBackend(
+        name="table",
+        ecc_types=_RS_TYPES | _BCH_TYPES,
+        batch=False,
+        factory=_table_codec,
+    )
+)
+register_backend(
+    EccBackend(
+        name="bchlib",
+        ecc_types=_BCH_TYPES,
+        batch=False,
+        factory=_bchlib_codec,
+        available=lambda: available(_ecc.bchlib),
+    )
+)
+register_backend(
+    EccBackend(
+        name="numpy",
+        ecc_types=_RS_TYPES | _BCH_TYPES,
+        batch=True,
+        factory=_numpy_codec,
+        available=lambda: available(_ecc.np),
+    )
+)
+
+
+def default_calibration_file() -> str:
+    config_home = os.environ.get("XDG_CONFIG_HOME")
+    if not config_home:
+        config_home = os.path.join(os.path.expanduser("~"), ".config")
+
+    return os.path.join(config_home, "qcom-nandc-pagify", "backends.json")
+
+
+# parsed calibration files
+_calibrations: Dict[str, Dict[str, str]] = {}
+
+
+def load_calibration(path: Optional[str] = None) -> Dict[str, str]:
+    """Read the saved backend choice (ECC type name -> backend name)"""
+    if path is None:
+        path = default_calibration_file()
+
+    calibration = _calibrations.get(path)
+    if calibration is not None:
+        return calibration
+
+    try:
+        with open(path, encoding="utf-8") as calibration_file:
+            calibration = json.load(calibration_file)
+    except (OSError, ValueError):
+        calibration = {}
+
+    if not isinstance(calibration, dict):
+        calibration = {}
+
+    _calibrations[path] = calibration
+    return calibration
+
+
+def calibrated_backend(
+    ecc: EccType, calibration_file: Optional[str] = None
+) -> Optional[str]:
+    """Saved backend choice for an ECC type; None when it is not usable"""
+    calibrated = load_calibration(calibration_file).get(ecc.name)
+
+    # only the saved backend is checked (and its modules imported)
+    backend = _backends.get(calibrated)
+    if backend is None or ecc not in backend.ecc_types:
+        return None
+
+    if not backend.available():
+        return None
+
+    return calibrated
+
+
+def create_codec(
+    ecc: EccType,
+    backend: Optional[str] = None,
+    calibration_file: Optional[str] = None,
+) -> EccMeta:
+    """Create codec for an ECC type
+
+    Without an explicit backend, the backend saved in calibration_file is
+    used. The default codecs are used when no calibration_file is given or
+    no (usable) backend was calibrated in it.
+    """
+    if backend is None and calibration_file is not None:
+        backend = calibrated_backend(ecc, calibration_file)
+
+    if backend is None:
+        if ecc in _RS_TYPES:
+            return EccRs()
+
+        return EccBch(_bch_bits(ecc))
+
+    return get_backend(backend, ecc).factory(ecc)
+
+
+def _benchmark(
+    ecc: EccType, backend: str, pages: bytes, min_time: float
+) -> float:
+    codec = get_backend(backend, ecc).factory(ecc)
+    data_size, _ = Chunk.sizes(ecc)
+
+    # the chunks are encoded like in Page.program_many()
+    if codec.batch:
+        chunk_count = len(pages) // data_size
+        chunk_data = np.frombuffer(
+            pages, dtype=np.uint8, count=chunk_count * data_size
+        ).reshape(chunk_count, data_size)
+
+        def encode() -> None:
+            codec.encode_many(chunk_data)
+    else:
+        chunks = [
+            pages[i : i + data_size]
+            for i in range(0, len(pages) - data_size + 1, data_size)
+        ]
+
+        def encode() -> None:
+            for chunk in chunks:
+                codec.encode(chunk)
+
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        encode()
+        rounds += 1
+
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / rounds
+
+
+def calibrate_backends(
+    path: Optional[str] = None,
+    page_count: int = 64,
+    min_time: float = 0.2,
+) -> Dict[str, Dict[str, float]]:
+    """Measure all available backends and save the fastest per ECC type
+
+    The ECC calculation for the chunks of page_count 2048 byte pages is
+    repeated for at least min_time seconds per backend. The average seconds
+    to encode all chunks of the page_count pages once are returned for each
+    ECC type and backend.
+    """
+    if path is None:
+        path = default_calibration_file()
+
+    rand = random.Random(0)
+    pages = bytes(rand.getrandbits(8) for _ in range(2048 * page_count))
+
+    results = {}  # type: Dict[str, Dict[str, float]]
+    choice = {}  # type: Dict[str, str]
+    for ecc in EccType:
+        timings = {}
+        for name in available_backends(ecc):
+            timings[name] = _benchmark(ecc, name, pages, min_time)
+
+        results[ecc.name] = timings
+        if timings:
+            choice[ecc.name] = min(timings, key=timings.get)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "w", encoding="utf-8") as calibration_file:
+        json.dump(choice, calibration_file, indent=2, sort_keys=True)
+        calibration_file.write("\n")
+
+    _calibrations[path] = choice
+
+    return results
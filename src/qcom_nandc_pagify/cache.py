@@ -0,0 +1,385 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import collections
+import hashlib
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from ._lazy import LazyModule, optional_module
+from .ecc import EccMeta
+
+np = optional_module("numpy")
+
+# only needed for the persistent cache
+sqlite3 = LazyModule("sqlite3")
+
+__all__ = [
+    "EccCache",
+    "EccDiskCache",
+]
+
+# number of digests which are looked up in a single SQL statement
+_SQL_BATCH = 500
+
+# maximum number of batches which are encoded without cache lookup after
+# batches without any cache hit
+_MAX_BYPASS = 64
+
+
+def _chunk_digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class EccCache(EccMeta):
+    """LRU cache for the ECC of chunks in front of another ECC codec
+
+    Chunks are identified by a 16 byte digest of their (padded) data - like
+    in EccDiskCache. An entry therefore needs about 200 bytes instead of
+    about 700 bytes with the chunk data as key. At most max_size results are
+    kept and the least recently used one is evicted first.
+
+    The lookup of a batch costs more than encoding it with a fast batch
+    encoder. Batches without any hit therefore cause the following batches
+    (1, 2, 4, ... up to 64) to bypass the cache.
+
+    The cache can be shared by multiple threads. The chunks are encoded
+    outside of its lock.
+    """
+
+    def __init__(self, codec: EccMeta, max_size: int) -> None:
+        if max_size <= 0:
+            raise ValueError("cache size must be larger than 0")
+
+        self.__codec = codec
+        self.__max_size = max_size
+        self.__cache = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__bypass = 0
+        self.__backoff = 0
+
+    def __store(self, key: bytes, ecc: bytes) -> None:
+        self.__cache[key] = ecc
+        if len(self.__cache) > self.__max_size:
+            self.__cache.popitem(last=False)
+
+    def encode(self, data: bytes) -> bytes:
+        key = _chunk_digest(data)
+
+        with self.__lock:
+            ecc = self.__cache.get(key)
+            if ecc is not None:
+                self.__hits += 1
+                self.__cache.move_to_end(key)
+                return ecc
+
+            self.__misses += 1
+
+        ecc = self.__codec.encode(data)
+
+        with self.__lock:
+            self.__store(key, ecc)
+
+        return ecc
+
+    def encode_many(self, data: "np.ndarray") -> "np.ndarray":
+        with self.__lock:
+            bypass = self.__bypass > 0
+            if bypass:
+                self.__bypass -= 1
+                self.__misses += len(data)
+
+        if bypass:
+            return self.__codec.encode_many(data)
+
+        # the rows are hashed without copying them
+        data = np.ascontiguousarray(data)
+        row_size = data.shape[1]
+        raw = memoryview(data).cast("B")
+        keys = [
+            _chunk_digest(raw[i : i + row_size])
+            for i in range(0, len(raw), row_size)
+        ]
+
+        cache = self.__cache
+        with self.__lock:
+            cached = [cache.get(key) for key in keys]
+
+            # a row of each chunk which is not yet cached
+            missing = {
+                key: i
+                for i, (key, chunk_ecc) in enumerate(zip(keys, cached))
+                if chunk_ecc is None
+            }
+
+            self.__misses += len(missing)
+            self.__hits += len(keys) - len(missing)
+
+            if len(missing) == len(keys):
+                self.__backoff = min(max(2 * self.__backoff, 1), _MAX_BYPASS)
+                self.__bypass = self.__backoff
+            else:
+                self.__backoff = 0
+                for key, chunk_ecc in zip(keys, cached):
+                    if chunk_ecc is not None:
+                        cache.move_to_end(key)
+
+        if not missing:
+            return np.frombuffer(b"".join(cached), dtype=np.uint8).reshape(
+                len(keys), self.size
+            )
+
+        if len(missing) == len(keys):
+            # only new and unique chunks - no reordering necessary
+            ecc = self.__codec.encode_many(data)
+        else:
+            ecc = self.__codec.encode_many(data[list(missing.values())])
+
+        size = self.size
+        ecc_bytes = ecc.tobytes()
+        new_ecc = dict(
+            zip(
+                missing,
+                (
+                    ecc_bytes[i : i + size]
+                    for i in range(0, len(ecc_bytes), size)
+                ),
+            )
+        )
+
+        with self.__lock:
+            cache.update(new_ecc)
+            for _ in range(len(cache) - self.__max_size):
+                cache.popitem(last=False)
+
+        if len(missing) == len(keys):
+            return ecc
+
+        ecc_parts = [
+            new_ecc[key] if chunk_ecc is None else chunk_ecc
+            for key, chunk_ecc in zip(keys, cached)
+        ]
+        return np.frombuffer(b"".join(ecc_parts), dtype=np.uint8).reshape(
+            len(keys), size
+        )
+
+    def correct(self, data: bytes, ecc: bytes) -> Tuple[int, bytes, bytes]:
+        return self.__codec.correct(data, ecc)
+
+    @property
+    def size(self) -> int:
+        return self.__codec.size
+
+    @property
+    def strength(self) -> int:
+        return self.__codec.strength
+
+    @property
+    def batch(self) -> bool:
+        return self.__codec.batch
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+
+class EccDiskCache(EccMeta):
+    """Persistent cache for the ECC of chunks in front of another ECC codec
+
+    The results are stored in an SQLite database and are identified by the
+    ECC type name, the chunk data size and a digest of the chunk data. It
+    can be shared by multiple processes. When more than max_size entries
+    are stored, the least recently used ones are evicted.
+
+    A lookup costs more than the calculation of a batch encoder. Batches
+    are therefore only looked up for codecs without a fast encode_many().
+
+    The database connection can be shared by multiple threads. The chunks
+    are encoded outside of its lock.
+    """
+
+    def __init__(
+        self, codec: EccMeta, path: str, name: str, max_size: int
+    ) -> None:
+        if max_size <= 0:
+            raise ValueError("cache size must be larger than 0")
+
+        self.__codec = codec
+        self.__name = name
+        self.__max_size = max_size
+        self.__hits = 0
+        self.__misses = 0
+        self.__lock = threading.Lock()
+
+        # all accesses to the connection are serialized by the lock
+        self.__db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.__db:
+            self.__db.execute("PRAGMA journal_mode=WAL")
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS ecc ("
+                "id INTEGER PRIMARY KEY, "
+                "type TEXT NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "digest BLOB NOT NULL, "
+                "parity BLOB NOT NULL, "
+                "used INTEGER NOT NULL, "
+                "UNIQUE (type, size, digest))"
+            )
+            self.__db.execute(
+                "CREATE INDEX IF NOT EXISTS ecc_used ON ecc (used)"
+            )
+
+        self.__evict()
+
+    def __evict(self) -> None:
+        with self.__db:
+            (entries,) = self.__db.execute(
+                "SELECT COUNT(*) FROM ecc"
+            ).fetchone()
+            if entries > self.__max_size:
+                self.__db.execute(
+                    "DELETE FROM ecc WHERE id IN "
+                    "(SELECT id FROM ecc ORDER BY used LIMIT ?)",
+                    (entries - self.__max_size,),
+                )
+                entries = self.__max_size
+
+        self.__entries = entries
+
+    def __lookup(self, size: int, keys: List[bytes]) -> Dict[bytes, bytes]:
+        found = {}
+        now = time.time_ns()
+
+        with self.__lock, self.__db:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start : start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.__db.execute(
+                    "SELECT id, digest, parity FROM ecc "
+                    "WHERE type = ? AND size = ? "
+                    f"AND digest IN ({placeholders})",
+                    (self.__name, size, *batch),
+                ).fetchall()
+
+                ids = [row[0] for row in rows]
+                placeholders = ",".join("?" * len(ids))
+                self.__db.execute(
+                    f"UPDATE ecc SET used = ? WHERE id IN ({placeholders})",
+                    (now, *ids),
+                )
+                found.update((row[1], row[2]) for row in rows)
+
+        return found
+
+    def __store(self, size: int, results: Dict[bytes, bytes]) -> None:
+        now = time.time_ns()
+
+        with self.__lock:
+            with self.__db:
+                self.__db.executemany(
+                    "INSERT OR REPLACE INTO ecc "
+                    "(type, size, digest, parity, used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (self.__name, size, key, ecc, now)
+                        for key, ecc in results.items()
+                    ],
+                )
+
+            # other processes may add entries too - the exact number of
+            # entries is only checked when the cache might be full
+            self.__entries += len(results)
+            if self.__entries > self.__max_size:
+                self.__evict()
+
+    def encode(self, data: bytes) -> bytes:
+        key = _chunk_digest(data)
+
+        ecc = self.__lookup(len(data), [key]).get(key)
+        if ecc is not None:
+            self.__count(1, 0)
+            return ecc
+
+        self.__count(0, 1)
+        ecc = self.__codec.encode(data)
+        self.__store(len(data), {key: ecc})
+
+        return ecc
+
+    def encode_many(self, data: "np.ndarray") -> "np.ndarray":
+        if self.__codec.batch:
+            return self.__codec.encode_many(data)
+
+        ecc = np.empty((len(data), self.size), dtype=np.uint8)
+        size = data.shape[1]
+
+        rows = collections.OrderedDict()
+        for i, chunk in enumerate(data):
+            rows.setdefault(_chunk_digest(chunk), []).append(i)
+
+        found = self.__lookup(size, list(rows))
+
+        missing = collections.OrderedDict()
+        for key, indices in rows.items():
+            cached = found.get(key)
+            if cached is None:
+                missing[key] = indices
+            else:
+                ecc[indices] = np.frombuffer(cached, dtype=np.uint8)
+
+        # repeated chunks of a batch are only encoded once
+        self.__count(len(data) - len(missing), len(missing))
+
+        if not missing:
+            return ecc
+
+        first_rows = [indices[0] for indices in missing.values()]
+        missing_ecc = self.__codec.encode_many(data[first_rows])
+
+        results = {}
+        for (key, indices), chunk_ecc in zip(missing.items(), missing_ecc):
+            ecc[indices] = chunk_ecc
+            results[key] = chunk_ecc.tobytes()
+
+        self.__store(size, results)
+
+        return ecc
+
+    def __count(self, hits: int, misses: int) -> None:
+        with self.__lock:
+            self.__hits += hits
+            self.__misses += misses
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__db.close()
+
+    def correct(self, data: bytes, ecc: bytes) -> Tuple[int, bytes, bytes]:
+        return self.__codec.correct(data, ecc)
+
+    @property
+    def size(self) -> int:
+        return self.__codec.size
+
+    @property
+    def strength(self) -> int:
+        return self.__codec.strength
+
+    @property
+    def batch(self) -> bool:
+        return self.__codec.batch
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
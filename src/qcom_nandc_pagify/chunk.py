@@ -1,7 +1,11 @@
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
 
+import time
+from typing import Optional, Tuple
+
 from .ecc import EccMeta, EccType
+from .stats import StageHook
 
 __all__ = [
     "Chunk",
@@ -18,55 +22,146 @@ def __init__(
         ecc=EccType.BCH4,
         page_size: int = 2048,
         widebus: bool = False,
+        stats_hook: Optional[StageHook] = None,
     ) -> None:
         self.__ecc = ecc
         self.__ecc_codec = ecc_codec
         self.__widebus = widebus
+        self.__stats_hook = stats_hook
 
         if self.__widebus:
             self.__bbm_size = 2
         else:
             self.__bbm_size = 1
 
-        if self.__ecc == EccType.RS:
-            self.__data_size = 516
-            self.__oob_per_chunk = 12
-        elif self.__ecc == EccType.RS_SBL:
-            self.__data_size = 512
-            self.__oob_per_chunk = 16
-        elif self.__ecc == EccType.BCH4:
-            self.__data_size = 516
-            self.__oob_per_chunk = 12
-        elif self.__ecc == EccType.BCH8:
-            self.__data_size = 516
-            self.__oob_per_chunk = 16
-        else:
-            raise ValueError("ecc invalid")
-
+        self.__data_size, self.__oob_per_chunk = self.sizes(self.__ecc)
         self.__bbm_pos = page_size % self.size
 
+        # padding which is copied into each chunk
+        ecc_padding = self.__oob_per_chunk - ecc_codec.size - self.__bbm_size
+        self.__bbm_fill = b"\xff" * self.__bbm_size
+        self.__ecc_fill = b"\xff" * ecc_padding
+        self.__data_fill = memoryview(b"\xff" * self.__data_size)
+
+    @staticmethod
+    def sizes(ecc: EccType) -> Tuple[int, int]:
+        """Number of data bytes and OOB bytes per chunk for an ECC type"""
+        if ecc == EccType.RS:
+            return 516, 12
+
+        if ecc == EccType.RS_SBL:
+            return 512, 16
+
+        if ecc == EccType.BCH4:
+            return 516, 12
+
+        if ecc == EccType.BCH8:
+            return 516, 16
+
+        raise ValueError("ecc invalid")
+
     def program(self, data: bytes) -> bytes:
-        # read a full data portion and add necessary padding
-        if len(data) < self.__data_size:
-            needed_padding = self.__data_size - len(data)
-            data += b"\xff" * needed_padding
+        chunk = bytearray(self.size)
+        self.program_into(data, chunk)
 
-        self.__data = self.__prepare_qca_chunk(data)
+        # return local result - the chunk may be shared between threads
+        result = bytes(chunk)
+        self.__data = result
 
-        return self.__data
+        return result
+
+    def program_into(self, data: bytes, buffer, offset: int = 0) -> None:
+        """Write the chunk for data to a writable buffer at offset
+
+        data can be any bytes-like object. A too short data portion is
+        padded in the buffer itself.
+        """
+        if len(data) > self.__data_size:
+            raise ValueError("data larger than chunk data size")
+
+        if not isinstance(data, memoryview):
+            data = memoryview(data)
+
+        if not isinstance(buffer, memoryview):
+            buffer = memoryview(buffer)
 
-    def __prepare_qca_chunk(self, data: bytes) -> bytes:
+        if len(data) < self.__data_size:
+            self.__prepare_short_chunk(data, buffer, offset)
+        else:
+            self.__prepare_qca_chunk(data, buffer, offset)
+
+    def __encode(self, data):
+        stats_hook = self.__stats_hook
+        if stats_hook is None:
+            return self.__ecc_codec.encode(data)
+
+        start = time.perf_counter()
         ecc = self.__ecc_codec.encode(data)
+        stats_hook("encode", time.perf_counter() - start, self.__data_size)
+
+        return ecc
 
-        chunk_parts = [
-            data[0 : self.__bbm_pos],
-            b"\xff" * self.__bbm_size,
-            data[self.__bbm_pos : self.__data_size],
-            ecc,
-            b"\xff" * (self.__oob_per_chunk - len(ecc) - self.__bbm_size),
-        ]
+    def __prepare_short_chunk(self, data, out, offset: int) -> None:
+        # the padded data portion is assembled at the start of the chunk
+        data_end = offset + self.__data_size
+        padding_start = offset + len(data)
+        out[offset:padding_start] = data
+        out[padding_start:data_end] = self.__data_fill[len(data) :]
 
-        return b"".join(chunk_parts)
+        ecc = self.__encode(out[offset:data_end])
+
+        stats_hook = self.__stats_hook
+        if stats_hook is not None:
+            start = time.perf_counter()
+
+        # move the second data part behind the BBM
+        bbm_start = offset + self.__bbm_pos
+        bbm_end = bbm_start + self.__bbm_size
+        out[bbm_end : data_end + self.__bbm_size] = out[bbm_start:data_end]
+        out[bbm_start:bbm_end] = self.__bbm_fill
+
+        self.__write_ecc(ecc, out, offset)
+
+        if stats_hook is not None:
+            stats_hook("layout", time.perf_counter() - start, self.size)
+
+    def __prepare_qca_chunk(self, data, out, offset: int) -> None:
+        ecc = self.__encode(data)
+
+        stats_hook = self.__stats_hook
+        if stats_hook is not None:
+            start = time.perf_counter()
+
+        bbm_pos = self.__bbm_pos
+        bbm_end = offset + bbm_pos + self.__bbm_size
+        ecc_start = offset + self.__data_size + self.__bbm_size
+
+        out[offset : offset + bbm_pos] = data[0:bbm_pos]
+        out[offset + bbm_pos : bbm_end] = self.__bbm_fill
+        out[bbm_end:ecc_start] = data[bbm_pos : self.__data_size]
+        self.__write_ecc(ecc, out, offset)
+
+        if stats_hook is not None:
+            stats_hook("layout", time.perf_counter() - start, self.size)
+
+    def __write_ecc(self, ecc: bytes, out, offset: int) -> None:
+        ecc_start = offset + self.__data_size + self.__bbm_size
+        ecc_end = ecc_start + len(ecc)
+
+        out[ecc_start:ecc_end] = ecc
+        out[ecc_end : offset + self.size] = self.__ecc_fill
+
+    def unprogram(self, chunk: bytes) -> bytes:
+        """Extract the (padded) data portion from a chunk"""
+        if len(chunk) != self.size:
+            raise ValueError("chunk has invalid size")
+
+        bbm_end = self.__bbm_pos + self.__bbm_size
+        data_end = self.__data_size + self.__bbm_size
+
+        return bytes(chunk[0 : self.__bbm_pos]) + bytes(
+            chunk[bbm_end:data_end]
+        )
 
     @property
     def data(self) -> bytes:
@@ -76,6 +171,18 @@ def data(self) -> bytes:
     def size(self) -> int:
         return self.__data_size + self.__oob_per_chunk
 
+    @property
+    def bbm_pos(self) -> int:
+        return self.__bbm_pos
+
+    @property
+    def bbm_size(self) -> int:
+        return self.__bbm_size
+
+    @property
+    def ecc_size(self) -> int:
+        return self.__ecc_codec.size
+
     @property
     def data_size(self) -> int:
         return self.__data_size
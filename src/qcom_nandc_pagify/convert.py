@@ -0,0 +1,995 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import collections
+import math
+import mmap
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from ._lazy import LazyModule
+from .backend import get_backend
+from .chunk import Chunk
+from .ecc import EccType
+from .index import PageIndex
+from .page import Page
+from .stats import StageHook
+
+# only needed for parallel conversions
+futures = LazyModule("concurrent.futures")
+mp_util = LazyModule("multiprocessing.util")
+
+__all__ = [
+    "PageConfig",
+    "PagifySummary",
+    "VerifySummary",
+    "depagify",
+    "pad_erased",
+    "pagify",
+    "pagify_incremental",
+    "pagify_mmap",
+    "pagify_pipeline",
+    "pagify_range",
+    "verify",
+]
+
+# number of pages which are converted together in a single batch
+BATCH_PAGES = 256
+
+# number of erased pages which are written together for padding
+PAD_PAGES = 512
+
+
+@dataclass(frozen=True)
+class PageConfig:
+    page_size: int = 2048
+    oob_size: int = 64
+    widebus: bool = False
+    ecc: EccType = EccType.BCH4
+    skip_erased: bool = False
+    ecc_cache_size: int = 0
+    ecc_cache_file: Optional[str] = None
+    ecc_cache_file_size: int = 1000000
+    ecc_backend: Optional[str] = None
+
+    @property
+    def nand_page_size(self) -> int:
+        return self.page_size + self.oob_size
+
+    def validate(self) -> None:
+        """Check the parameters without creating a page converter"""
+        Page.check_geometry(self.page_size, self.oob_size, self.ecc)
+
+        if self.ecc_backend is not None:
+            get_backend(self.ecc_backend, self.ecc)
+
+    def create_page(self, stats_hook: Optional[StageHook] = None) -> Page:
+        return Page(
+            page_size=self.page_size,
+            oob_size=self.oob_size,
+            widebus=self.widebus,
+            ecc=self.ecc,
+            skip_erased=self.skip_erased,
+            ecc_cache_size=self.ecc_cache_size,
+            ecc_cache_file=self.ecc_cache_file,
+            ecc_cache_file_size=self.ecc_cache_file_size,
+            ecc_backend=self.ecc_backend,
+            stats_hook=stats_hook,
+        )
+
+
+# page converter of the current worker process
+_worker_page: Optional[Page] = None
+
+
+def _worker_init(config: PageConfig) -> None:
+    global _worker_page
+
+    _worker_page = config.create_page()
+
+    # worker processes don't run atexit handlers - only the finalizers of
+    # multiprocessing when they are shut down
+    mp_util.Finalize(None, _worker_page.close, exitpriority=0)
+
+
+def _worker_program(data: bytes) -> bytes:
+    return _worker_page.program_many(data)
+
+
+def _worker_verify(data: bytes) -> Tuple[List[int], bytes]:
+    return _worker_page.verify_many(data)
+
+
+# page converters of worker processes in pools without initializer
+_process_pages: Dict[PageConfig, Page] = {}
+
+
+def _process_program(config: PageConfig, data: bytes) -> bytes:
+    page = _process_pages.get(config)
+    if page is None:
+        page = config.create_page()
+        mp_util.Finalize(None, page.close, exitpriority=0)
+        _process_pages[config] = page
+
+    return page.program_many(data)
+
+
+# memory mappings of the current worker process
+_worker_maps: Optional[Tuple[PageConfig, mmap.mmap, mmap.mmap]] = None
+
+
+def _worker_init_mmap(config: PageConfig, infile: str, outfile: str) -> None:
+    global _worker_maps
+
+    _worker_init(config)
+    _worker_maps = (config, *_map_files(infile, outfile))
+
+
+def _worker_program_mmap(first_page: int, page_count: int) -> None:
+    config, in_map, out_map = _worker_maps
+    _program_mapped(
+        _worker_page, config, in_map, out_map, first_page, page_count
+    )
+
+
+def _map_files(infile: str, outfile: str) -> Tuple[mmap.mmap, mmap.mmap]:
+    with open(infile, "rb") as in_file:
+        in_map = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    with open(outfile, "r+b") as out_file:
+        out_map = mmap.mmap(out_file.fileno(), 0, access=mmap.ACCESS_WRITE)
+
+    return in_map, out_map
+
+
+def _program_mapped(
+    page: Page,
+    config: PageConfig,
+    in_map: mmap.mmap,
+    out_map: mmap.mmap,
+    first_page: int,
+    page_count: int,
+) -> None:
+    in_start = first_page * config.page_size
+    in_end = min(in_start + page_count * config.page_size, len(in_map))
+    out_start = first_page * config.nand_page_size
+
+    with memoryview(in_map) as in_view:
+        page_data = in_view[in_start:in_end]
+        page.program_many_into(page_data, out_map, out_start)
+        page_data.release()
+
+
+@dataclass
+class PagifySummary:
+    # number of converted input pages
+    pages: int = 0
+    # number of pages for which the NAND page was calculated
+    encoded_pages: int = 0
+    # number of runs of at least two identical consecutive pages
+    runs: int = 0
+    # number of pages which were identical to their previous page
+    repeated_pages: int = 0
+    # chunks found in / missing from the ECC cache (of the current process)
+    ecc_cache_hits: int = 0
+    ecc_cache_misses: int = 0
+
+    def add_cache(self, page: Page) -> None:
+        """Add the ECC cache counters of a page converter
+
+        The misses of the in-memory cache are looked up in the cache file
+        (when both are used). Only misses of the last cache are counted.
+        """
+        cache = page.ecc_cache
+        disk_cache = page.ecc_disk_cache
+
+        if cache is not None:
+            self.ecc_cache_hits += cache.hits
+            if disk_cache is None:
+                self.ecc_cache_misses += cache.misses
+
+        if disk_cache is not None:
+            self.ecc_cache_hits += disk_cache.hits
+            self.ecc_cache_misses += disk_cache.misses
+
+
+@dataclass
+class VerifySummary:
+    # number of checked NAND pages
+    pages: int = 0
+    # number of checked chunks
+    chunks: int = 0
+    # number of chunks with correctable bitflips
+    corrected_chunks: int = 0
+    # number of corrected bitflips
+    bitflips: int = 0
+    # number of chunks with uncorrectable bitflips
+    uncorrectable_chunks: int = 0
+    # (page, chunk, bitflips) of each chunk with bitflips, -1 = uncorrectable
+    errors: List[Tuple[int, int, int]] = field(default_factory=list)
+
+    def add(self, bitflips: List[int], chunks_per_page: int) -> None:
+        for i, flips in enumerate(bitflips):
+            if flips == 0:
+                continue
+
+            page, chunk = divmod(i, chunks_per_page)
+            self.errors.append((self.pages + page, chunk, flips))
+
+            if flips < 0:
+                self.uncorrectable_chunks += 1
+            else:
+                self.corrected_chunks += 1
+                self.bitflips += flips
+
+        self.chunks += len(bitflips)
+        self.pages += len(bitflips) // chunks_per_page
+
+
+class _RunDetector:
+    """Split batches of pages in runs of identical consecutive pages"""
+
+    def __init__(self, page_size: int, summary: PagifySummary) -> None:
+        self.__page_size = page_size
+        self.__summary = summary
+        self.__last_page = None  # type: Optional[bytes]
+        self.__run_length = 0
+
+    def split(self, data: bytes) -> Tuple[bytes, List[int], bool]:
+        """Get the unique pages of a batch and the length of their runs
+
+        The returned flag is set when the first page continues the run of
+        the last page of the previous batch.
+        """
+        pages = []  # type: List[bytes]
+        counts = []  # type: List[int]
+
+        for i in range(0, len(data), self.__page_size):
+            page_data = data[i : i + self.__page_size]
+            if pages and page_data == pages[-1]:
+                counts[-1] += 1
+            else:
+                pages.append(page_data)
+                counts.append(1)
+
+        continued = pages[0] == self.__last_page
+
+        for i, count in enumerate(counts):
+            run_length = count
+            repeated = count - 1
+            if i == 0 and continued:
+                run_length += self.__run_length
+                repeated += 1
+
+            if run_length >= 2 and run_length - count < 2:
+                self.__summary.runs += 1
+
+            self.__summary.repeated_pages += repeated
+            self.__run_length = run_length
+
+        self.__summary.pages += sum(counts)
+        self.__last_page = pages[-1]
+
+        return b"".join(pages), counts, continued
+
+
+def _read_batch(
+    data_in: BinaryIO, size: int, stats_hook: Optional[StageHook]
+) -> bytes:
+    if stats_hook is None:
+        return data_in.read(size)
+
+    start = time.perf_counter()
+    data = data_in.read(size)
+    stats_hook("read", time.perf_counter() - start, len(data))
+
+    return data
+
+
+def _write_runs(
+    data_out: BinaryIO,
+    nand_pages: bytes,
+    counts: List[int],
+    page_size: int,
+    stats_hook: Optional[StageHook] = None,
+) -> None:
+    start = time.perf_counter()
+
+    for i, count in enumerate(counts):
+        nand_page = nand_pages[i * page_size : (i + 1) * page_size]
+        data_out.write(nand_page * count)
+
+    if stats_hook is not None:
+        size = sum(counts) * page_size
+        stats_hook("write", time.perf_counter() - start, size)
+
+
+def _pagify_serial(
+    data_in: BinaryIO,
+    data_out: BinaryIO,
+    config: PageConfig,
+    batch_pages: int,
+    stats_hook: Optional[StageHook],
+) -> PagifySummary:
+    with config.create_page(stats_hook) as page:
+        summary = PagifySummary()
+        runs = _RunDetector(config.page_size, summary)
+        last_nand_page = b""
+
+        while True:
+            data = _read_batch(
+                data_in, config.page_size * batch_pages, stats_hook
+            )
+            if len(data) == 0:
+                break
+
+            pages, counts, continued = runs.split(data)
+
+            # the NAND page for a continued run is already known
+            if continued:
+                pages = pages[config.page_size :]
+
+            nand_pages = page.program_many(pages)
+            summary.encoded_pages += len(counts) - continued
+
+            if continued:
+                nand_pages = last_nand_page + nand_pages
+
+            _write_runs(
+                data_out, nand_pages, counts, config.nand_page_size, stats_hook
+            )
+            last_nand_page = nand_pages[-config.nand_page_size :]
+
+        summary.add_cache(page)
+        return summary
+
+
+def _pagify_parallel(
+    data_in: BinaryIO,
+    data_out: BinaryIO,
+    config: PageConfig,
+    jobs: int,
+    batch_pages: int,
+    threads: bool,
+    stats_hook: Optional[StageHook],
+) -> PagifySummary:
+    summary = PagifySummary()
+    runs = _RunDetector(config.page_size, summary)
+
+    # limit the number of batches which are read but not yet written
+    max_in_flight = 2 * jobs
+    in_flight = collections.deque()
+
+    # the hook can only be called from worker threads - not processes. The
+    # threads share a single page converter which is closed after the run
+    page = None
+    if threads:
+        page = config.create_page(stats_hook)
+        executor = futures.ThreadPoolExecutor(max_workers=jobs)
+        program = page.program_many
+    else:
+        executor = futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=_worker_init, initargs=(config,)
+        )
+        program = _worker_program
+
+    try:
+        with executor:
+            while True:
+                data = _read_batch(
+                    data_in, config.page_size * batch_pages, stats_hook
+                )
+                if len(data) == 0:
+                    break
+
+                pages, counts, _ = runs.split(data)
+                summary.encoded_pages += len(counts)
+
+                future = executor.submit(program, pages)
+                in_flight.append((future, counts))
+
+                # write finished batches in the same order as they were read
+                if len(in_flight) >= max_in_flight:
+                    future, counts = in_flight.popleft()
+                    _write_runs(
+                        data_out,
+                        future.result(),
+                        counts,
+                        config.nand_page_size,
+                        stats_hook,
+                    )
+
+            while in_flight:
+                future, counts = in_flight.popleft()
+                _write_runs(
+                    data_out,
+                    future.result(),
+                    counts,
+                    config.nand_page_size,
+                    stats_hook,
+                )
+    finally:
+        if page is not None:
+            page.close()
+
+    return summary
+
+
+def pagify(
+    data_in: BinaryIO,
+    data_out: BinaryIO,
+    config: PageConfig,
+    jobs: int = 1,
+    batch_pages: int = BATCH_PAGES,
+    threads: bool = False,
+    stats_hook: Optional[StageHook] = None,
+) -> PagifySummary:
+    """Convert a raw image stream to qcom,nandc pages
+
+    The input is processed as "page_size" byte pages (+ necessary padding)
+    and written as "page_size + oob_size" pages. With jobs > 1, batches of
+    batch_pages pages are converted by a pool of worker processes (or
+    worker threads when threads is set).
+
+    Runs of identical consecutive pages are only converted once and their
+    NAND page is then written repeatedly.
+
+    stats_hook is called after each read, encode, layout and write
+    operation. The encode and layout stages of worker processes are not
+    reported.
+    """
+    # check configuration before any worker is started
+    config.validate()
+
+    if jobs <= 1:
+        return _pagify_serial(
+            data_in, data_out, config, batch_pages, stats_hook
+        )
+
+    return _pagify_parallel(
+        data_in, data_out, config, jobs, batch_pages, threads, stats_hook
+    )
+
+
+def _read_full(data_in: BinaryIO, buffer: bytearray) -> int:
+    # raw streams may return less data than requested before the end
+    with memoryview(buffer) as view:
+        size = 0
+        while size < len(view):
+            count = data_in.readinto(view[size:])
+            if not count:
+                break
+
+            size += count
+
+    return size
+
+
+def _pipeline_reader(
+    data_in: BinaryIO,
+    free: queue.Queue,
+    filled: queue.Queue,
+    stats_hook: Optional[StageHook],
+) -> None:
+    try:
+        while True:
+            buffer = free.get()
+            if buffer is None:
+                return
+
+            start = time.perf_counter()
+            size = _read_full(data_in, buffer)
+            if stats_hook is not None:
+                stats_hook("read", time.perf_counter() - start, size)
+
+            if size == 0:
+                break
+
+            filled.put((buffer, size))
+    except BaseException as exc:
+        filled.put(exc)
+        return
+
+    filled.put(None)
+
+
+def _pipeline_writer(
+    data_out: BinaryIO,
+    free: queue.Queue,
+    written: queue.Queue,
+    errors: List[BaseException],
+    stats_hook: Optional[StageHook],
+) -> None:
+    while True:
+        item = written.get()
+        if item is None:
+            return
+
+        buffer, size = item
+
+        # the buffers must still be recycled after an error
+        if not errors:
+            try:
+                start = time.perf_counter()
+                with memoryview(buffer) as view:
+                    data_out.write(view[:size])
+
+                if stats_hook is not None:
+                    stats_hook("write", time.perf_counter() - start, size)
+            except BaseException as exc:
+                errors.append(exc)
+
+        free.put(buffer)
+
+
+def pagify_pipeline(
+    data_in: BinaryIO,
+    data_out: BinaryIO,
+    config: PageConfig,
+    batch_pages: int = BATCH_PAGES,
+    buffers: int = 3,
+    stats_hook: Optional[StageHook] = None,
+) -> PagifySummary:
+    """Convert a raw image stream with overlapping I/O and ECC calculation
+
+    A reader thread prefetches batches of pages and a writer thread writes
+    the converted batches while the next batch is converted. Each stage has
+    a pool of "buffers" reusable buffers - a stage has to wait for a free
+    buffer when the next stage is too slow.
+
+    stats_hook is called (from the reader, writer and converting thread)
+    after each read, encode, layout and write operation.
+    """
+    if buffers <= 0:
+        raise ValueError("number of buffers must be larger than 0")
+
+    page = config.create_page(stats_hook)
+    summary = PagifySummary()
+
+    in_size = config.page_size * batch_pages
+    out_size = config.nand_page_size * batch_pages
+
+    # the queues can take all buffers + a stop marker without blocking
+    free_in = queue.Queue(maxsize=buffers + 1)
+    free_out = queue.Queue(maxsize=buffers)
+    for _ in range(buffers):
+        free_in.put(bytearray(in_size))
+        free_out.put(bytearray(out_size))
+
+    filled = queue.Queue(maxsize=buffers + 1)
+    written = queue.Queue(maxsize=buffers + 1)
+    errors = []  # type: List[BaseException]
+
+    reader = threading.Thread(
+        target=_pipeline_reader, args=(data_in, free_in, filled, stats_hook)
+    )
+    writer = threading.Thread(
+        target=_pipeline_writer,
+        args=(data_out, free_out, written, errors, stats_hook),
+    )
+    reader.start()
+    writer.start()
+
+    try:
+        while True:
+            item = filled.get()
+            if item is None:
+                break
+
+            if isinstance(item, BaseException):
+                raise item
+
+            in_buffer, size = item
+            page_count = math.ceil(size / config.page_size)
+
+            out_buffer = free_out.get()
+            if errors:
+                raise errors[0]
+
+            with memoryview(in_buffer) as in_view:
+                page.program_many_into(in_view[:size], out_buffer)
+
+            free_in.put(in_buffer)
+            written.put((out_buffer, page_count * config.nand_page_size))
+
+            summary.pages += page_count
+            summary.encoded_pages += page_count
+    finally:
+        written.put(None)
+        writer.join()
+
+        # stop the reader (when it is still running)
+        free_in.put(None)
+        reader.join()
+
+        page.close()
+
+    if errors:
+        raise errors[0]
+
+    summary.add_cache(page)
+    return summary
+
+
+class _LimitedReader:
+    """Read at most size bytes from a stream"""
+
+    def __init__(self, data_in: BinaryIO, size: Optional[int]) -> None:
+        self.__data_in = data_in
+        self.__remaining = size
+
+    def read(self, size: int) -> bytes:
+        if self.__remaining is None:
+            return self.__data_in.read(size)
+
+        data = self.__data_in.read(min(size, self.__remaining))
+        self.__remaining -= len(data)
+
+        return data
+
+
+def pagify_range(
+    data_in: BinaryIO,
+    data_out: BinaryIO,
+    config: PageConfig,
+    start_page: int,
+    count: Optional[int] = None,
+    jobs: int = 1,
+    batch_pages: int = BATCH_PAGES,
+    threads: bool = False,
+) -> PagifySummary:
+    """Convert only a window of pages of a raw image
+
+    Both (seekable) streams are positioned at start_page and up to count
+    pages (or all remaining pages) are converted. The output is neither
+    truncated nor extended beyond the converted pages - the other pages of
+    an existing NAND image stay untouched.
+    """
+    if start_page < 0:
+        raise ValueError("start page must not be negative")
+
+    data_in.seek(start_page * config.page_size)
+    data_out.seek(start_page * config.nand_page_size)
+
+    size = None
+    if count is not None:
+        size = count * config.page_size
+
+    return pagify(
+        _LimitedReader(data_in, size),
+        data_out,
+        config,
+        jobs=jobs,
+        batch_pages=batch_pages,
+        threads=threads,
+    )
+
+
+def depagify(
+    data_in: BinaryIO,
+    data_out: BinaryIO,
+    config: PageConfig,
+    batch_pages: int = BATCH_PAGES,
+) -> PagifySummary:
+    """Extract the raw image from a stream of qcom,nandc pages
+
+    The input is processed in batches of "page_size + oob_size" NAND pages.
+    For each of them, the "page_size" data bytes without BBM, ECC and
+    padding are written.
+    """
+    with config.create_page() as page:
+        summary = PagifySummary()
+
+        while True:
+            data = data_in.read(config.nand_page_size * batch_pages)
+            if len(data) == 0:
+                break
+
+            if len(data) % config.nand_page_size != 0:
+                raise ValueError("Input doesn't end with a complete NAND page")
+
+            data_out.write(page.unprogram_many(data))
+            summary.pages += len(data) // config.nand_page_size
+
+        return summary
+
+
+def _index_params(config: PageConfig) -> Dict[str, Any]:
+    # only the parameters which influence the NAND pages
+    return {
+        "page_size": config.page_size,
+        "oob_size": config.oob_size,
+        "widebus": config.widebus,
+        "ecc": config.ecc.name,
+        "skip_erased": config.skip_erased,
+    }
+
+
+def pagify_incremental(
+    infile: str,
+    outfile: str,
+    config: PageConfig,
+    index_file: Optional[str] = None,
+    batch_pages: int = BATCH_PAGES,
+    pad_pages: Optional[int] = None,
+    sparse: bool = False,
+) -> PagifySummary:
+    """Convert a raw image file and only update its changed NAND pages
+
+    The digests of all input pages are stored in the index_file (default:
+    outfile + ".idx"). When the index and the unmodified output of an
+    earlier conversion with the same parameters exist, only the NAND pages
+    of changed input pages are calculated and patched in the output file.
+    Otherwise, the complete image is converted.
+
+    With pad_pages, the output is padded to this number of NAND pages (see
+    pad_erased). The padding of the earlier conversion is kept when neither
+    the number of pages nor the padding parameters changed.
+    """
+    if index_file is None:
+        index_file = outfile + ".idx"
+
+    padding = None
+    if pad_pages is not None:
+        padding = {"pages": pad_pages, "sparse": sparse}
+
+    with config.create_page() as page:
+        params = _index_params(config)
+        nand_page_size = config.nand_page_size
+
+        index = PageIndex.load(index_file, params, outfile)
+        if index is None:
+            index = PageIndex(params)
+            out_mode = "wb"
+            old_pages = 0
+            old_padding = None
+        else:
+            out_mode = "r+b"
+            old_pages = len(index)
+            old_padding = index.padding
+
+        # an interrupted update must not leave an index for a mixed output
+        if os.path.exists(index_file):
+            os.remove(index_file)
+
+        summary = PagifySummary()
+
+        with open(infile, "rb") as data_in, open(
+            outfile, out_mode
+        ) as data_out:
+            while True:
+                data = data_in.read(config.page_size * batch_pages)
+                if len(data) == 0:
+                    break
+
+                first_page = summary.pages
+                page_count = math.ceil(len(data) / config.page_size)
+                changed = [
+                    index.update(
+                        first_page + i,
+                        data[
+                            i * config.page_size : (i + 1) * config.page_size
+                        ],
+                    )
+                    for i in range(page_count)
+                ]
+
+                # write consecutive changed pages together
+                start = 0
+                while start < page_count:
+                    if not changed[start]:
+                        start += 1
+                        continue
+
+                    end = start
+                    while end < page_count and changed[end]:
+                        end += 1
+
+                    raw = data[
+                        start * config.page_size : end * config.page_size
+                    ]
+                    data_out.seek((first_page + start) * nand_page_size)
+                    data_out.write(page.program_many(raw))
+
+                    summary.encoded_pages += end - start
+                    start = end
+
+                summary.pages += page_count
+
+            if pad_pages is not None and summary.pages > pad_pages:
+                raise ValueError("input image larger than padded size")
+
+            # pages of a larger image or the old padding are replaced
+            if summary.pages != old_pages or padding != old_padding:
+                data_out.truncate(summary.pages * nand_page_size)
+                data_out.seek(summary.pages * nand_page_size)
+
+                if pad_pages is not None:
+                    pad_erased(
+                        data_out,
+                        config,
+                        pad_pages - summary.pages,
+                        sparse=sparse,
+                    )
+
+        index.truncate(summary.pages)
+        index.save(index_file, outfile, padding)
+
+        summary.add_cache(page)
+        return summary
+
+
+def pagify_mmap(
+    infile: str,
+    outfile: str,
+    config: PageConfig,
+    jobs: int = 1,
+    batch_pages: int = BATCH_PAGES,
+) -> PagifySummary:
+    """Convert a raw image file to qcom,nandc pages using memory mappings
+
+    The output file is created with its final size. Each batch of pages is
+    then written directly in its slot of the mapped output file. With
+    jobs > 1, the worker processes map both files on their own and only the
+    page ranges are sent to them.
+    """
+    config.validate()
+
+    page_count = math.ceil(os.path.getsize(infile) / config.page_size)
+    with open(outfile, "wb") as out_file:
+        out_file.truncate(page_count * config.nand_page_size)
+
+    summary = PagifySummary(pages=page_count, encoded_pages=page_count)
+
+    # empty files cannot be mapped
+    if page_count == 0:
+        return summary
+
+    batches = [
+        (first_page, min(batch_pages, page_count - first_page))
+        for first_page in range(0, page_count, batch_pages)
+    ]
+
+    if jobs <= 1:
+        in_map, out_map = _map_files(infile, outfile)
+        with in_map, out_map, config.create_page() as page:
+            for first_page, count in batches:
+                _program_mapped(
+                    page, config, in_map, out_map, first_page, count
+                )
+
+            summary.add_cache(page)
+
+        return summary
+
+    # limit the number of batches which are queued but not yet finished
+    max_in_flight = 2 * jobs
+    in_flight = collections.deque()
+
+    with futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_worker_init_mmap,
+        initargs=(config, infile, outfile),
+    ) as executor:
+        for first_page, count in batches:
+            future = executor.submit(_worker_program_mmap, first_page, count)
+            in_flight.append(future)
+
+            if len(in_flight) >= max_in_flight:
+                in_flight.popleft().result()
+
+        while in_flight:
+            in_flight.popleft().result()
+
+    return summary
+
+
+def pad_erased(
+    data_out: BinaryIO,
+    config: PageConfig,
+    page_count: int,
+    sparse: bool = False,
+) -> None:
+    """Append page_count erased (all 0xff) NAND pages
+
+    In sparse mode, the file is only extended. The new pages are then holes
+    which read as 0x00 - this is only usable for tools which handle them
+    like erased pages.
+    """
+    if page_count < 0:
+        raise ValueError("page_count must not be negative")
+
+    size = page_count * config.nand_page_size
+
+    if sparse:
+        end = data_out.tell() + size
+        data_out.truncate(end)
+        data_out.seek(end)
+        return
+
+    block_pages = min(page_count, PAD_PAGES)
+    block = b"\xff" * (block_pages * config.nand_page_size)
+
+    for _ in range(page_count // PAD_PAGES):
+        data_out.write(block)
+
+    remaining = page_count % PAD_PAGES
+    data_out.write(block[: remaining * config.nand_page_size])
+
+
+def _verify_batches(
+    data_in: BinaryIO,
+    config: PageConfig,
+    jobs: int,
+    batch_pages: int,
+) -> Iterator[Tuple[List[int], bytes]]:
+    def read_batch() -> bytes:
+        data = data_in.read(config.nand_page_size * batch_pages)
+        if len(data) % config.nand_page_size != 0:
+            raise ValueError("Input doesn't end with a complete NAND page")
+
+        return data
+
+    if jobs <= 1:
+        with config.create_page() as page:
+            while True:
+                data = read_batch()
+                if len(data) == 0:
+                    break
+
+                yield page.verify_many(data)
+        return
+
+    # limit the number of batches which are read but not yet checked
+    max_in_flight = 2 * jobs
+    in_flight = collections.deque()
+
+    with futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_worker_init,
+        initargs=(config,),
+    ) as executor:
+        while True:
+            data = read_batch()
+            if len(data) == 0:
+                break
+
+            in_flight.append(executor.submit(_worker_verify, data))
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().result()
+
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def verify(
+    data_in: BinaryIO,
+    config: PageConfig,
+    data_out: Optional[BinaryIO] = None,
+    jobs: int = 1,
+    batch_pages: int = BATCH_PAGES,
+) -> VerifySummary:
+    """Check the ECC of all chunks in a stream of qcom,nandc pages
+
+    Chunks with wrong ECC are corrected (when possible) and reported in the
+    returned summary. The corrected pages are written to data_out when it
+    is given. numpy is required for the verification.
+    """
+    config.validate()
+
+    chunk_data_size, _ = Chunk.sizes(config.ecc)
+    chunks_per_page = math.ceil(config.page_size / chunk_data_size)
+    summary = VerifySummary()
+
+    for bitflips, corrected in _verify_batches(
+        data_in, config, jobs, batch_pages
+    ):
+        summary.add(bitflips, chunks_per_page)
+        if data_out is not None:
+            data_out.write(corrected)
+
+    return summary
@@ -1,13 +1,18 @@
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
 
+import functools
 import math
+import threading
 from abc import ABCMeta, abstractmethod
 from enum import Enum
-from typing import List
+from typing import List, Optional, Tuple
 
-import bchlib
-import reedsolo as rs
+from ._lazy import available, optional_module
+
+# optional modules are only imported when they are used
+bchlib = optional_module("bchlib")
+np = optional_module("numpy")
 
 __all__ = [
     "EccBch",
@@ -23,69 +28,694 @@ class EccType(Enum):
     BCH8 = 4
 
 
+# serializes the first build of the shared tables
+_TABLE_LOCK = threading.RLock()
+
+
+def _shared_table(func):
+    """Build a table only once per arguments and share it between threads
+
+    The tables are tuples or read-only numpy arrays and therefore safe to be
+    used concurrently - also on free-threaded Python builds.
+    """
+    cached = functools.lru_cache(maxsize=None)(func)
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        with _TABLE_LOCK:
+            return cached(*args)
+
+    return wrapper
+
+
+def _require_numpy() -> None:
+    if not available(np):
+        raise ImportError("numpy is required for batch encoding")
+
+
+def _check_numpy(use_numpy: Optional[bool]) -> bool:
+    if use_numpy is None:
+        return available(np)
+
+    if use_numpy:
+        _require_numpy()
+
+    return use_numpy
+
+
 class EccMeta(metaclass=ABCMeta):
     @abstractmethod
     def encode(self, data: bytes) -> bytes:
         pass
 
+    def encode_many(self, data: "np.ndarray") -> "np.ndarray":
+        """Calculate ECC for each row of a (N, chunk data size) uint8 array
+
+        The result is a (N, size) uint8 array. Codecs without a dedicated
+        batch implementation fall back to one encode call per chunk.
+        """
+        _require_numpy()
+
+        ecc = np.empty((len(data), self.size), dtype=np.uint8)
+        for i, chunk in enumerate(data):
+            ecc[i] = np.frombuffer(self.encode(chunk.tobytes()), np.uint8)
+
+        return ecc
+
+    def correct(self, data: bytes, ecc: bytes) -> Tuple[int, bytes, bytes]:
+        """Correct bitflips in a chunk's data and its stored ECC
+
+        The number of corrected bits is returned together with the corrected
+        data and ECC. -1 and the unmodified input are returned when the
+        errors are not correctable.
+        """
+        raise NotImplementedError(f"{type(self).__name__} cannot correct")
+
     @property
     @abstractmethod
     def size(self) -> int:
         pass
 
+    @property
+    def batch(self) -> bool:
+        """Whether encode_many() is faster than one encode() per chunk"""
+        return False
+
+    @property
+    def strength(self) -> int:
+        """Maximum number of correctable bits/symbols per chunk"""
+        raise NotImplementedError(f"{type(self).__name__} cannot correct")
+
+
+class _GaloisField:
+    """Log/antilog tables for GF(2**m) with the given primitive polynomial"""
+
+    def __init__(self, m: int, prim: int) -> None:
+        self.order = (1 << m) - 1
+
+        gf_exp = [0] * (2 * self.order)
+        gf_log = [0] * (self.order + 1)
+
+        x = 1
+        for i in range(self.order):
+            gf_exp[i] = x
+            gf_log[x] = i
+            x <<= 1
+            if x & (1 << m):
+                x ^= prim
+
+        # duplicate antilog table to avoid the modulo in multiplications
+        for i in range(self.order, 2 * self.order):
+            gf_exp[i] = gf_exp[i - self.order]
+
+        self.exp = tuple(gf_exp)
+        self.log = tuple(gf_log)
+
+    def mul(self, x: int, y: int) -> int:
+        if x == 0 or y == 0:
+            return 0
+
+        return self.exp[self.log[x] + self.log[y]]
+
+    def div(self, x: int, y: int) -> int:
+        if y == 0:
+            raise ZeroDivisionError("division by zero in GF")
+
+        if x == 0:
+            return 0
+
+        return self.exp[self.log[x] + self.order - self.log[y]]
+
+    def pow_alpha(self, power: int) -> int:
+        return self.exp[power % self.order]
+
+    def poly_eval(self, poly: List[int], x: int) -> int:
+        """Evaluate polynomial (lowest degree first) at x"""
+        result = 0
+        for coef in reversed(poly):
+            result = self.mul(result, x) ^ coef
+
+        return result
+
+
+def _berlekamp_massey(field: _GaloisField, syndromes: List[int]) -> List[int]:
+    """Error locator polynomial (lowest degree first) for the syndromes"""
+    locator = [1]
+    previous = [1]
+    errors = 0
+    shift = 1
+    previous_discrepancy = 1
+
+    for n, syndrome in enumerate(syndromes):
+        discrepancy = syndrome
+        for i in range(1, errors + 1):
+            discrepancy ^= field.mul(locator[i], syndromes[n - i])
+
+        if discrepancy == 0:
+            shift += 1
+            continue
+
+        coef = field.div(discrepancy, previous_discrepancy)
+        update = [0] * shift + [field.mul(coef, c) for c in previous]
+        next_locator = locator + [0] * (len(update) - len(locator))
+        for i, value in enumerate(update):
+            next_locator[i] ^= value
+
+        if 2 * errors <= n:
+            previous = locator
+            previous_discrepancy = discrepancy
+            errors = n + 1 - errors
+            shift = 1
+        else:
+            shift += 1
+
+        locator = next_locator
+
+    return locator[: errors + 1]
+
+
+def _error_positions(
+    field: _GaloisField, locator: List[int], length: int
+) -> Optional[List[int]]:
+    """Degrees k < length of all errors (roots alpha**-k of the locator)
+
+    None is returned when the locator doesn't have the expected number of
+    roots in this range - the errors are then not correctable.
+    """
+    errors = len(locator) - 1
+    positions = [
+        k
+        for k in range(length)
+        if field.poly_eval(locator, field.pow_alpha(-k)) == 0
+    ]
+
+    if len(positions) != errors:
+        return None
+
+    return positions
+
+
+def _popcount_diff(old: bytes, new: bytes) -> int:
+    diff = int.from_bytes(old, "big") ^ int.from_bytes(new, "big")
+    return bin(diff).count("1")
+
+
+# BCH over GF(2**13) with polynomial x**13 + x**4 + x**3 + x**1 + 1
+_BCH_PRIM = 8219
+_BCH_M = 13
+
+
+def _gf2_mul(x: int, y: int) -> int:
+    """Carry-less multiplication of two GF(2) polynomials"""
+    result = 0
+    while y:
+        if y & 1:
+            result ^= x
+        x <<= 1
+        y >>= 1
+
+    return result
+
+
+@_shared_table
+def _bch_field() -> _GaloisField:
+    return _GaloisField(_BCH_M, _BCH_PRIM)
+
+
+@_shared_table
+def _bch_generator_poly(bits: int) -> int:
+    """Generator polynomial (bit n = coefficient of x**n) for t = bits
+
+    It is the product of the minimal polynomials of alpha**1, alpha**3, ...,
+    alpha**(2 * bits - 1) - like in Linux's lib/bch.c.
+    """
+    field = _bch_field()
+
+    gen = 1
+    used_roots = set()
+    for i in range(1, 2 * bits, 2):
+        if i in used_roots:
+            continue
+
+        # the conjugates alpha**(i * 2**k) share the same minimal polynomial
+        coset = []
+        root = i
+        while root not in coset:
+            coset.append(root)
+            root = (root * 2) % field.order
+        used_roots.update(coset)
+
+        # minimal polynomial with GF(2**13) coefficients, lowest degree first
+        minimal = [1]
+        for root in coset:
+            factor = field.exp[root]
+            next_minimal = [0, *minimal]
+            for j, coef in enumerate(minimal):
+                next_minimal[j] ^= field.mul(coef, factor)
+            minimal = next_minimal
+
+        # all coefficients of a minimal polynomial are either 0 or 1
+        minimal_poly = sum(coef << j for j, coef in enumerate(minimal))
+        gen = _gf2_mul(gen, minimal_poly)
+
+    return gen
+
+
+@_shared_table
+def _bch_remainder_table(bits: int) -> Tuple[int, ...]:
+    """Remainders of (byte * x**ecc_bits) mod generator for all bytes"""
+    gen = _bch_generator_poly(bits)
+    ecc_bits = gen.bit_length() - 1
+
+    table = []
+    for byte in range(256):
+        remainder = byte << ecc_bits
+        for bit in range(7 + ecc_bits, ecc_bits - 1, -1):
+            if remainder & (1 << bit):
+                remainder ^= gen << (bit - ecc_bits)
+        table.append(remainder)
+
+    return tuple(table)
+
+
+@_shared_table
+def _bch_parity_matrix(bits: int, data_size: int) -> "np.ndarray":
+    """Systematic parity matrix for chunks of data_size bytes
+
+    BCH is linear over GF(2). The parity of a chunk is therefore the XOR of
+    the parities of each of its bytes at its position. The matrix contains
+    these parities (big endian, packed in 64 bit words) for every position
+    and every possible byte value: shape (words, data_size * 256).
+    """
+    table = _bch_remainder_table(bits)
+    ecc_bits = bits * _BCH_M
+    words = math.ceil(ecc_bits / 64)
+    padding = words * 64 - ecc_bits
+    mask = (1 << ecc_bits) - 1
+
+    # parities of the single bits, starting with the last byte of the chunk
+    bit_parities = bytearray()
+    remainders = [table[1 << bit] for bit in range(8)]
+    for _ in range(data_size):
+        for remainder in remainders:
+            bit_parities += (remainder << padding).to_bytes(words * 8, "big")
+
+        # move one byte further away from the end: multiply by x**8
+        remainders = [
+            ((r << 8) & mask) ^ table[r >> (ecc_bits - 8)] for r in remainders
+        ]
+
+    bit_matrix = np.frombuffer(bit_parities, dtype=">u8")
+    bit_matrix = bit_matrix.astype(np.uint64).reshape(data_size, 8, words)
+    bit_matrix = bit_matrix[::-1]
+
+    # expand to all byte values by XORing the parities of the set bits
+    matrix = np.zeros((data_size, 256, words), dtype=np.uint64)
+    for bit in range(8):
+        low = 1 << bit
+        matrix[:, low : 2 * low] = matrix[:, :low] ^ bit_matrix[:, bit, None]
+
+    matrix = np.ascontiguousarray(matrix.transpose(2, 0, 1).reshape(words, -1))
+    matrix.flags.writeable = False
+
+    return matrix
+
 
 class EccBch(EccMeta):
-    def __init__(self, bits: int = 4) -> None:
+    """BCH encoder compatible with Linux's lib/bch.c
+
+    The calculation is done by bchlib when it is installed. Otherwise (or
+    when use_bchlib is False), a byte-at-a-time table driven LFSR is used.
+    Both produce the same ECC bytes.
+
+    bchlib's BCH objects use internal buffers. Each thread therefore gets
+    its own one.
+
+    Batches are encoded with a numpy parity matrix when numpy is available
+    and use_numpy is not False.
+    """
+
+    def __init__(
+        self,
+        bits: int = 4,
+        use_bchlib: Optional[bool] = None,
+        use_numpy: Optional[bool] = None,
+    ) -> None:
         self.__bits = bits
-        self.__bch = bchlib.BCH(bits, prim_poly=8219)
+        self.__use_numpy = _check_numpy(use_numpy)
+
+        if use_bchlib is None:
+            use_bchlib = available(bchlib)
+
+        if use_bchlib:
+            if not available(bchlib):
+                raise ImportError("bchlib is not available")
+
+            self.__local = threading.local()
+            self.__encode = self.__encode_bchlib
+        else:
+            self.__table = _bch_remainder_table(bits)
+            self.__encode = self.__encode_table
+
+    def __encode_bchlib(self, data: bytes) -> bytes:
+        bch = getattr(self.__local, "bch", None)
+        if bch is None:
+            bch = bchlib.BCH(self.__bits, prim_poly=_BCH_PRIM)
+            self.__local.bch = bch
+
+        # bchlib never releases the buffer of other bytes-like objects - a
+        # memoryview of an mmap could then no longer be closed
+        if not isinstance(data, bytes):
+            data = bytes(data)
+
+        return bch.encode(data)
+
+    def __encode_table(self, data: bytes) -> bytes:
+        table = self.__table
+        ecc_bits = self.__bits * _BCH_M
+        shift = ecc_bits - 8
+        mask = (1 << ecc_bits) - 1
+
+        remainder = 0
+        for byte in data:
+            index = (remainder >> shift) ^ byte
+            remainder = ((remainder << 8) & mask) ^ table[index]
+
+        # the remainder is stored MSB first and padded with 0 bits
+        padding = self.size * 8 - ecc_bits
+        return (remainder << padding).to_bytes(self.size, "big")
 
     def encode(self, data: bytes) -> bytes:
-        return self.__bch.encode(data)
+        return self.__encode(data)
+
+    def encode_many(self, data: "np.ndarray") -> "np.ndarray":
+        if not self.__use_numpy:
+            return super().encode_many(data)
+
+        if data.ndim != 2:
+            raise ValueError("ECC data must be a two dimensional array")
+
+        count, data_size = data.shape
+        matrix = _bch_parity_matrix(self.__bits, data_size)
+        words = len(matrix)
+
+        # index of the parity for each byte value at each position
+        offsets = np.arange(0, data_size * 256, 256, dtype=np.intp)
+
+        # limit the size of the gathered (block, data_size) parities
+        block = 1024
+
+        ecc = np.empty((count, words), dtype=np.uint64)
+        for start in range(0, count, block):
+            indices = data[start : start + block] + offsets
+            for word in range(words):
+                parities = np.take(matrix[word], indices)
+                ecc[start : start + block, word] = np.bitwise_xor.reduce(
+                    parities, axis=1
+                )
+
+        ecc = ecc.astype(">u8").view(np.uint8).reshape(count, words * 8)
+        return ecc[:, : self.size]
+
+    def correct(self, data: bytes, ecc: bytes) -> Tuple[int, bytes, bytes]:
+        if len(ecc) != self.size:
+            raise ValueError("ECC has invalid size")
+
+        field = _bch_field()
+        ecc_bits = self.__bits * _BCH_M
+        padding = self.size * 8 - ecc_bits
+        length = len(data) * 8 + ecc_bits
+
+        # the received word has the same syndromes as its remainder
+        calculated = int.from_bytes(self.encode(data), "big")
+        remainder = (calculated ^ int.from_bytes(ecc, "big")) >> padding
+        if remainder == 0:
+            return 0, bytes(data), bytes(ecc)
+
+        degrees = [k for k in range(ecc_bits) if remainder >> k & 1]
+        syndromes = []
+        for j in range(1, 2 * self.__bits + 1):
+            syndrome = 0
+            for k in degrees:
+                syndrome ^= field.pow_alpha(j * k)
+            syndromes.append(syndrome)
+
+        locator = _berlekamp_massey(field, syndromes)
+        if len(locator) - 1 > self.__bits:
+            return -1, bytes(data), bytes(ecc)
+
+        positions = _error_positions(field, locator, length)
+        if positions is None:
+            return -1, bytes(data), bytes(ecc)
+
+        # data bits are the highest degrees (MSB first), followed by the ECC
+        fixed_data = int.from_bytes(data, "big")
+        fixed_ecc = int.from_bytes(ecc, "big")
+        for k in positions:
+            if k >= ecc_bits:
+                fixed_data ^= 1 << (k - ecc_bits)
+            else:
+                fixed_ecc ^= 1 << (k + padding)
+
+        fixed_data = fixed_data.to_bytes(len(data), "big")
+        fixed_ecc = fixed_ecc.to_bytes(len(ecc), "big")
+
+        if self.encode(fixed_data) != fixed_ecc:
+            return -1, bytes(data), bytes(ecc)
+
+        return len(positions), fixed_data, fixed_ecc
 
     @property
     def size(self) -> int:
-        return math.ceil(self.__bits * 13 / 8)
+        return math.ceil(self.__bits * _BCH_M / 8)
 
+    @property
+    def strength(self) -> int:
+        return self.__bits
 
-class EccRs(EccMeta):
-    def __init__(self) -> None:
-        rs.init_tables(c_exp=10, prim=0x409)
-        self.__gen = rs.rs_generator_poly(8, fcr=1)
+    @property
+    def batch(self) -> bool:
+        return self.__use_numpy
+
+
+# Reed-Solomon over GF(2**10) with polynomial x**10 + x**3 + 1, 8 parity
+# symbols and the first consecutive root at alpha**1
+_RS_PRIM = 0x409
+_RS_NSYM = 8
+_RS_MSG_SYMBOLS = 1015
+
+
+@_shared_table
+def _rs_field() -> _GaloisField:
+    return _GaloisField(10, _RS_PRIM)
+
+
+@_shared_table
+def _rs_generator_poly() -> Tuple[int, ...]:
+    field = _rs_field()
+
+    gen = [1]
+    for i in range(1, _RS_NSYM + 1):
+        root = field.exp[i]
+
+        # gen * (x - root), coefficients with highest degree first
+        next_gen = [*gen, 0]
+        for j, coef in enumerate(gen):
+            next_gen[j + 1] ^= field.mul(coef, root)
+        gen = next_gen
+
+    return tuple(gen)
 
-    @staticmethod
-    def __10bit_ecc_to_bytes(eccpre: List[int]) -> bytes:
-        eccbytes = []
-        pos = 0
-        for i in range(10):
-            relpos = i % 5
-            if relpos != 0:
-                pos += 1
 
-            byte = 0
+@_shared_table
+def _rs_feedback_table() -> Tuple[int, ...]:
+    """Products of all feedback values with the generator polynomial
 
-            shift_cur_byte = 2 * relpos
-            if shift_cur_byte != 8:
-                byte += eccpre[pos] << shift_cur_byte
+    The LFSR register is kept as single 80 bit integer. The parity symbol
+    which will be stored first on the NAND is in the lowest 10 bits. Each
+    entry of this table contains the 8 products gen[1..8] * feedback packed
+    the same way.
+    """
+    field = _rs_field()
+    gen = _rs_generator_poly()
 
-            shift_last_byte = 10 - 2 * relpos
-            if shift_last_byte != 10:
-                byte += eccpre[pos - 1] >> shift_last_byte
+    table = []
+    for feedback in range(1024):
+        packed = 0
+        for j in range(_RS_NSYM):
+            packed |= field.mul(gen[j + 1], feedback) << (10 * j)
+        table.append(packed)
 
-            byte &= 0xFF
-            eccbytes.append(byte)
+    return tuple(table)
 
-        return bytes(eccbytes)
+
+@_shared_table
+def _rs_feedback_arrays() -> Tuple["np.ndarray", "np.ndarray"]:
+    """Feedback table split in two 40 bit halves for 64 bit numpy lanes"""
+    table = _rs_feedback_table()
+    mask = (1 << 40) - 1
+
+    low = np.array([x & mask for x in table], dtype=np.uint64)
+    high = np.array([x >> 40 for x in table], dtype=np.uint64)
+    low.flags.writeable = False
+    high.flags.writeable = False
+
+    return low, high
+
+
+class EccRs(EccMeta):
+    """Reed-Solomon encoder for the 10 bit symbols of the NAND controller
+
+    The GF(2**10) tables are built once and shared read-only by all
+    instances. An instance can therefore be used from multiple threads.
+
+    Batches are encoded with vectorized numpy operations when numpy is
+    available and use_numpy is not False.
+    """
+
+    def __init__(self, use_numpy: Optional[bool] = None) -> None:
+        self.__feedback = _rs_feedback_table()
+        self.__use_numpy = _check_numpy(use_numpy)
 
     def encode(self, data: bytes) -> bytes:
-        if len(data) > 1015:
+        if len(data) > _RS_MSG_SYMBOLS:
             raise ValueError("ECC data larger than 1015 bytes")
 
-        padded_data = b"\x00" * (1015 - len(data)) + data
-        array_data = [int(x) for x in padded_data]
-        eccpre = rs.rs_encode_msg(array_data, 8, gen=self.__gen)[1015:]
+        # The data is encoded with (1015 - len(data)) leading zero symbols.
+        # These never change the (still empty) LFSR register and can
+        # therefore be skipped completely.
+        feedback = self.__feedback
+        reg = 0
+        for symbol in data:
+            reg = (reg >> 10) ^ feedback[(reg & 0x3FF) ^ symbol]
+
+        # the 8 10 bit parity symbols are stored as little endian 80 bit
+        # string on the NAND - which is exactly the layout of the register
+        return reg.to_bytes(10, "little")
+
+    def encode_many(self, data: "np.ndarray") -> "np.ndarray":
+        if not self.__use_numpy:
+            return super().encode_many(data)
+
+        if data.ndim != 2:
+            raise ValueError("ECC data must be a two dimensional array")
+
+        if data.shape[1] > _RS_MSG_SYMBOLS:
+            raise ValueError("ECC data larger than 1015 bytes")
+
+        # Same LFSR as in encode() but for all chunks at once. The 80 bit
+        # register is split in the parity symbols 0-3 (low) and 4-7 (high)
+        feedback_low, feedback_high = _rs_feedback_arrays()
+        symbols = np.ascontiguousarray(data.T, dtype=np.uint64)
+        count = data.shape[0]
+
+        low = np.zeros(count, dtype=np.uint64)
+        high = np.zeros(count, dtype=np.uint64)
+        feedback = np.empty(count, dtype=np.uint64)
+        tmp = np.empty(count, dtype=np.uint64)
+
+        mask = np.uint64(0x3FF)
+        shift_symbol = np.uint64(10)
+        shift_high = np.uint64(30)
+
+        for column in symbols:
+            np.bitwise_and(low, mask, out=feedback)
+            np.bitwise_xor(feedback, column, out=feedback)
+
+            np.bitwise_and(high, mask, out=tmp)
+            np.left_shift(tmp, shift_high, out=tmp)
+            np.right_shift(low, shift_symbol, out=low)
+            np.bitwise_or(low, tmp, out=low)
+            np.right_shift(high, shift_symbol, out=high)
+
+            np.take(feedback_low, feedback, out=tmp)
+            np.bitwise_xor(low, tmp, out=low)
+            np.take(feedback_high, feedback, out=tmp)
+            np.bitwise_xor(high, tmp, out=high)
+
+        # both halves contain 40 bit (5 bytes) of the little endian string
+        ecc = np.empty((count, 10), dtype=np.uint8)
+        ecc[:, :5] = low.astype("<u8").view(np.uint8).reshape(count, 8)[:, :5]
+        ecc[:, 5:] = high.astype("<u8").view(np.uint8).reshape(count, 8)[:, :5]
 
-        return self.__10bit_ecc_to_bytes(eccpre)
+        return ecc
+
+    def correct(self, data: bytes, ecc: bytes) -> Tuple[int, bytes, bytes]:
+        if len(data) > _RS_MSG_SYMBOLS:
+            raise ValueError("ECC data larger than 1015 bytes")
+
+        if len(ecc) != self.size:
+            raise ValueError("ECC has invalid size")
+
+        field = _rs_field()
+
+        # received word with the highest degree first
+        parity = int.from_bytes(ecc, "little")
+        word = list(data)
+        word += [(parity >> (10 * j)) & 0x3FF for j in range(_RS_NSYM)]
+
+        syndromes = []
+        for j in range(1, _RS_NSYM + 1):
+            syndrome = 0
+            root = field.exp[j]
+            for symbol in word:
+                syndrome = field.mul(syndrome, root) ^ symbol
+            syndromes.append(syndrome)
+
+        if not any(syndromes):
+            return 0, bytes(data), bytes(ecc)
+
+        locator = _berlekamp_massey(field, syndromes)
+        if len(locator) - 1 > self.strength:
+            return -1, bytes(data), bytes(ecc)
+
+        positions = _error_positions(field, locator, len(word))
+        if positions is None:
+            return -1, bytes(data), bytes(ecc)
+
+        # Forney: evaluator = syndromes * locator mod x**nsym
+        evaluator = [0] * _RS_NSYM
+        for i, syndrome in enumerate(syndromes):
+            for j, coef in enumerate(locator[: _RS_NSYM - i]):
+                evaluator[i + j] ^= field.mul(syndrome, coef)
+
+        # formal derivative only keeps the odd powers in GF(2**m)
+        derivative = [
+            coef if i % 2 == 0 else 0 for i, coef in enumerate(locator[1:])
+        ]
+
+        for k in positions:
+            x_inv = field.pow_alpha(-k)
+            magnitude = field.div(
+                field.poly_eval(evaluator, x_inv),
+                field.poly_eval(derivative, x_inv),
+            )
+            word[len(word) - 1 - k] ^= magnitude
+
+        # corrected data symbols must still be bytes
+        if any(symbol > 0xFF for symbol in word[: len(data)]):
+            return -1, bytes(data), bytes(ecc)
+
+        fixed_data = bytes(word[: len(data)])
+        fixed_parity = 0
+        for j, symbol in enumerate(word[len(data) :]):
+            fixed_parity |= symbol << (10 * j)
+        fixed_ecc = fixed_parity.to_bytes(self.size, "little")
+
+        if self.encode(fixed_data) != fixed_ecc:
+            return -1, bytes(data), bytes(ecc)
+
+        bitflips = _popcount_diff(bytes(data) + ecc, fixed_data + fixed_ecc)
+        return bitflips, fixed_data, fixed_ecc
 
     @property
     def size(self) -> int:
         return 10
+
+    @property
+    def strength(self) -> int:
+        return _RS_NSYM // 2
+
+    @property
+    def batch(self) -> bool:
+        return self.__use_numpy
@@ -0,0 +1,102 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+from .page import Page
+
+__all__ = [
+    "NandLocation",
+    "PageGeometry",
+]
+
+
+@dataclass(frozen=True)
+class NandLocation:
+    # number of the NAND page
+    page: int
+    # number of the chunk in the NAND page
+    chunk: int
+    # offset in the chunk (BBM included)
+    chunk_offset: int
+    # offset in the NAND image
+    offset: int
+
+
+class PageGeometry:
+    """Map offsets between a raw image and its qcom,nandc pages
+
+    Each raw page is stored in one NAND page. Its data is split over the
+    chunks of the NAND page and the BBM is inserted in each chunk at the
+    same position.
+    """
+
+    def __init__(self, page: Page) -> None:
+        chunk = page.chunk
+
+        self.__page_size = page.data_size
+        self.__nand_page_size = page.size
+        self.__chunk_size = chunk.size
+        self.__data_size = chunk.data_size
+        self.__bbm_pos = chunk.bbm_pos
+        self.__bbm_size = chunk.bbm_size
+        self.__no_chunks = math.ceil(self.__page_size / self.__data_size)
+
+    def raw_to_nand(self, offset: int) -> NandLocation:
+        """Get location of a raw image byte in the NAND image"""
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+
+        page_no, page_offset = divmod(offset, self.__page_size)
+        chunk_no, data_offset = divmod(page_offset, self.__data_size)
+
+        chunk_offset = data_offset
+        if data_offset >= self.__bbm_pos:
+            chunk_offset += self.__bbm_size
+
+        nand_offset = page_no * self.__nand_page_size
+        nand_offset += chunk_no * self.__chunk_size + chunk_offset
+
+        return NandLocation(page_no, chunk_no, chunk_offset, nand_offset)
+
+    def nand_to_raw(self, offset: int) -> Optional[int]:
+        """Get raw image offset of a NAND image byte
+
+        None is returned for bytes without raw data (BBM, ECC, padding).
+        """
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+
+        page_no, page_offset = divmod(offset, self.__nand_page_size)
+        chunk_no, chunk_offset = divmod(page_offset, self.__chunk_size)
+        if chunk_no >= self.__no_chunks:
+            return None
+
+        bbm_end = self.__bbm_pos + self.__bbm_size
+        if self.__bbm_pos <= chunk_offset < bbm_end:
+            return None
+
+        data_offset = chunk_offset
+        if chunk_offset >= bbm_end:
+            data_offset -= self.__bbm_size
+
+        if data_offset >= self.__data_size:
+            return None
+
+        raw_offset = chunk_no * self.__data_size + data_offset
+        if raw_offset >= self.__page_size:
+            return None
+
+        return page_no * self.__page_size + raw_offset
+
+    def raw_page_offset(self, page_no: int) -> int:
+        return page_no * self.__page_size
+
+    def nand_page_offset(self, page_no: int) -> int:
+        return page_no * self.__nand_page_size
+
+    @property
+    def no_chunks(self) -> int:
+        return self.__no_chunks
@@ -0,0 +1,133 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import hashlib
+import json
+import os
+import struct
+from typing import Any, Dict, List, Optional
+
+__all__ = [
+    "PageIndex",
+]
+
+_INDEX_MAGIC = b"QNPIDX02"
+_DIGEST_SIZE = 16
+
+
+def _page_digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=_DIGEST_SIZE).digest()
+
+
+def _output_state(out_stat: os.stat_result) -> Dict[str, int]:
+    # any other writer of the output changes its size or modification time
+    return {"size": out_stat.st_size, "mtime_ns": out_stat.st_mtime_ns}
+
+
+class PageIndex:
+    """Digests of all input pages of a converted image
+
+    The index is stored as sidecar file next to the output. It allows to
+    find the input pages which changed since the last conversion. The
+    parameters of the conversion and the size and modification time of the
+    written output are stored with it - an index of a different
+    configuration or for a modified output is never used.
+    """
+
+    def __init__(self, params: Dict[str, Any]) -> None:
+        self.__params = params
+        self.__digests: List[bytes] = []
+        self.__padding: Optional[Dict[str, Any]] = None
+
+    @staticmethod
+    def load(
+        path: str, params: Dict[str, Any], outfile: str
+    ) -> Optional["PageIndex"]:
+        """Read index file; None when it is missing, broken or not matching"""
+        try:
+            with open(path, "rb") as index_file:
+                data = index_file.read()
+            out_stat = os.stat(outfile)
+        except FileNotFoundError:
+            return None
+
+        header_start = len(_INDEX_MAGIC) + 4
+        if len(data) < header_start or not data.startswith(_INDEX_MAGIC):
+            return None
+
+        (header_size,) = struct.unpack_from("<I", data, len(_INDEX_MAGIC))
+        header_end = header_start + header_size
+        try:
+            header = json.loads(data[header_start:header_end])
+        except ValueError:
+            return None
+
+        if not isinstance(header, dict) or header.get("params") != params:
+            return None
+
+        if header.get("output") != _output_state(out_stat):
+            return None
+
+        digests = data[header_end:]
+        if len(digests) % _DIGEST_SIZE != 0:
+            return None
+
+        index = PageIndex(params)
+        index.__padding = header.get("padding")
+        index.__digests = [
+            digests[i : i + _DIGEST_SIZE]
+            for i in range(0, len(digests), _DIGEST_SIZE)
+        ]
+
+        return index
+
+    def save(
+        self, path: str, outfile: str, padding: Optional[Dict[str, Any]]
+    ) -> None:
+        """Atomically replace the index file
+
+        It must be saved after the outfile was completely written. The
+        padding parameters of the outfile are stored as they are.
+        """
+        self.__padding = padding
+        header = {
+            "params": self.__params,
+            "output": _output_state(os.stat(outfile)),
+            "padding": padding,
+        }
+        header = json.dumps(header, sort_keys=True).encode()
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as index_file:
+            index_file.write(_INDEX_MAGIC)
+            index_file.write(struct.pack("<I", len(header)))
+            index_file.write(header)
+            index_file.write(b"".join(self.__digests))
+
+        os.replace(tmp_path, path)
+
+    def update(self, page_no: int, data: bytes) -> bool:
+        """Store digest of an input page and check whether it changed"""
+        digest = _page_digest(data)
+
+        if page_no < len(self.__digests):
+            changed = self.__digests[page_no] != digest
+            self.__digests[page_no] = digest
+            return changed
+
+        if page_no != len(self.__digests):
+            raise ValueError("pages must be added in order")
+
+        self.__digests.append(digest)
+        return True
+
+    def truncate(self, page_count: int) -> None:
+        del self.__digests[page_count:]
+
+    @property
+    def padding(self) -> Optional[Dict[str, Any]]:
+        """Padding parameters of the outfile when the index was saved"""
+        return self.__padding
+
+    def __len__(self) -> int:
+        return len(self.__digests)
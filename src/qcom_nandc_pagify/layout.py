@@ -0,0 +1,124 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import math
+from typing import Tuple
+
+from ._lazy import available, optional_module
+from .chunk import Chunk
+
+np = optional_module("numpy")
+
+__all__ = [
+    "PageLayout",
+]
+
+
+class PageLayout:
+    """Precompiled layout of all chunks in a NAND page
+
+    The position of each data and ECC byte in the NAND page only depends on
+    page size, ECC type and widebus. It is calculated once and then used to
+    convert batches of pages with a single scatter per data/ECC into a 0xff
+    filled page template.
+    """
+
+    def __init__(self, chunk: Chunk, page_size: int, oob_size: int) -> None:
+        if not available(np):
+            raise ImportError("numpy is required for the page layout")
+
+        self.__chunk = chunk
+        self.__page_size = page_size
+        self.__oob_size = oob_size
+        self.__no_chunks = math.ceil(page_size / chunk.data_size)
+
+        # NAND page offset of each raw data byte
+        raw_offsets = np.arange(page_size)
+        chunk_no, chunk_offset = np.divmod(raw_offsets, chunk.data_size)
+        bbm_skip = np.where(chunk_offset >= chunk.bbm_pos, chunk.bbm_size, 0)
+        self.__data_index = chunk_no * chunk.size + chunk_offset + bbm_skip
+
+        # NAND page offset of each (padded) data byte of all chunks
+        chunk_offsets = np.arange(self.__no_chunks * chunk.data_size)
+        chunk_no, chunk_offset = np.divmod(chunk_offsets, chunk.data_size)
+        bbm_skip = np.where(chunk_offset >= chunk.bbm_pos, chunk.bbm_size, 0)
+        self.__chunk_index = chunk_no * chunk.size + chunk_offset + bbm_skip
+
+        # NAND page offset of each ECC byte
+        ecc_start = chunk.data_size + chunk.bbm_size
+        ecc_index = np.arange(chunk.ecc_size) + ecc_start
+        chunk_starts = np.arange(self.__no_chunks) * chunk.size
+        self.__ecc_index = (chunk_starts[:, None] + ecc_index).reshape(-1)
+
+        self.__template = np.full(self.size, 0xFF, dtype=np.uint8)
+
+    def chunk_data(self, raw: "np.ndarray") -> "np.ndarray":
+        """Split (N, page_size) raw pages in (N * chunks, data_size) chunks
+
+        The last data portion of each page is padded with 0xff.
+        """
+        data_size = self.__chunk.data_size
+        chunks_size = self.__no_chunks * data_size
+
+        if chunks_size == self.__page_size:
+            return raw.reshape(-1, data_size)
+
+        chunks = np.full((len(raw), chunks_size), 0xFF, dtype=np.uint8)
+        chunks[:, : self.__page_size] = raw
+
+        return chunks.reshape(-1, data_size)
+
+    def pagify(
+        self, raw: "np.ndarray", ecc: "np.ndarray", out: "np.ndarray"
+    ) -> None:
+        """Write (N, size) NAND pages for raw pages and their chunks' ECC"""
+        out[:] = self.__template
+        out[:, self.__data_index] = raw
+        out[:, self.__ecc_index] = ecc.reshape(len(raw), len(self.__ecc_index))
+
+    def depagify(self, pages: "np.ndarray") -> "np.ndarray":
+        """Extract the (N, page_size) raw pages from (N, size) NAND pages"""
+        return pages[:, self.__data_index]
+
+    def split_chunks(
+        self, pages: "np.ndarray"
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Get data and stored ECC of all chunks in (N, size) NAND pages
+
+        The result are (N * chunks, data_size) and (N * chunks, ecc_size)
+        arrays.
+        """
+        data = pages[:, self.__chunk_index]
+        ecc = pages[:, self.__ecc_index]
+
+        return (
+            data.reshape(-1, self.__chunk.data_size),
+            ecc.reshape(-1, self.__chunk.ecc_size),
+        )
+
+    def merge_chunks(
+        self, data: "np.ndarray", ecc: "np.ndarray", out: "np.ndarray"
+    ) -> None:
+        """Write data and ECC of all chunks back into (N, size) NAND pages"""
+        out[:, self.__chunk_index] = data.reshape(len(out), -1)
+        out[:, self.__ecc_index] = ecc.reshape(len(out), -1)
+
+    @property
+    def chunk_index(self) -> "np.ndarray":
+        return self.__chunk_index
+
+    @property
+    def data_index(self) -> "np.ndarray":
+        return self.__data_index
+
+    @property
+    def ecc_index(self) -> "np.ndarray":
+        return self.__ecc_index
+
+    @property
+    def no_chunks(self) -> int:
+        return self.__no_chunks
+
+    @property
+    def size(self) -> int:
+        return self.__page_size + self.__oob_size
@@ -2,18 +2,32 @@
 # SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
 
 import math
+import time
+from typing import List, Optional, Tuple
 
+from ._lazy import available, optional_module
+from .backend import create_codec
+from .cache import EccCache, EccDiskCache
 from .chunk import Chunk
-from .ecc import EccBch, EccRs, EccType
+from .ecc import EccType
+from .layout import PageLayout
+from .stats import StageHook
+
+np = optional_module("numpy")
 
 __all__ = [
     "Page",
 ]
 
 
+def _popcount(data: bytes) -> int:
+    return bin(int.from_bytes(data, "big")).count("1")
+
+
 class Page:
     __data = None  # type: bytes
     __ecc_codec = None  # type: EccMeta
+    __layout = None  # type: PageLayout
 
     def __init__(
         self,
@@ -21,60 +35,334 @@ def __init__(
         oob_size: int = 64,
         widebus: bool = False,
         ecc=EccType.BCH4,
+        skip_erased: bool = False,
+        ecc_cache_size: int = 0,
+        ecc_cache_file: Optional[str] = None,
+        ecc_cache_file_size: int = 1000000,
+        ecc_backend: Optional[str] = None,
+        stats_hook: Optional[StageHook] = None,
     ) -> None:
         self.__page_size = page_size
         self.__oob_size = oob_size
         self.__widebus = widebus
         self.__ecc = ecc
+        self.__skip_erased = skip_erased
+        self.__stats_hook = stats_hook
+        self.__disk_cache = None  # type: Optional[EccDiskCache]
 
-        if self.__ecc == EccType.RS or self.__ecc == EccType.RS_SBL:
-            self.__ecc_codec = EccRs()
-        elif self.__ecc == EccType.BCH4:
-            self.__ecc_codec = EccBch(4)
-        elif self.__ecc == EccType.BCH8:
-            self.__ecc_codec = EccBch(8)
-        else:
-            raise ValueError("ecc invalid")
+        self.check_geometry(page_size, oob_size, ecc)
+
+        self.__ecc_codec = create_codec(self.__ecc, ecc_backend)
+
+        if ecc_cache_file is not None:
+            self.__disk_cache = EccDiskCache(
+                self.__ecc_codec,
+                ecc_cache_file,
+                self.__ecc.name,
+                ecc_cache_file_size,
+            )
+            self.__ecc_codec = self.__disk_cache
+
+        if ecc_cache_size > 0:
+            self.__ecc_codec = EccCache(self.__ecc_codec, ecc_cache_size)
 
         self.__chunk = Chunk(
             self.__ecc_codec,
             ecc=self.__ecc,
             page_size=self.__page_size,
             widebus=self.__widebus,
+            stats_hook=stats_hook,
         )
 
         no_chunks = math.ceil(self.__page_size / self.__chunk.data_size)
         required_size = no_chunks * self.__chunk.size
-        if required_size > self.__page_size + self.__oob_size:
+        self.__page_fill = b"\xff" * (self.size - required_size)
+
+        # all-0xff input pages are written as erased page (without ECC)
+        # when skip_erased is enabled - like they would be read from NAND
+        self.__erased_data = b"\xff" * self.__page_size
+        self.__erased_page = b"\xff" * self.size
+
+    @staticmethod
+    def check_geometry(page_size: int, oob_size: int, ecc: EccType) -> None:
+        """Check that all chunks of a page fit in its data + OOB area
+
+        A ValueError is raised for invalid parameters.
+        """
+        if not isinstance(ecc, EccType):
+            raise ValueError("ecc invalid")
+
+        data_size, oob_per_chunk = Chunk.sizes(ecc)
+        no_chunks = math.ceil(page_size / data_size)
+        if no_chunks * (data_size + oob_per_chunk) > page_size + oob_size:
             raise ValueError("ECC needs more than available OOB size")
 
+    def close(self) -> None:
+        """Close the ECC cache file (when one is used)"""
+        if self.__disk_cache is not None:
+            self.__disk_cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
     def program(self, data: bytes) -> bytes:
+        page = bytearray(self.size)
+        self.program_into(data, page)
+
+        # return local result - the page may be shared between threads
+        result = bytes(page)
+        self.__data = result
+
+        return result
+
+    def program_into(self, data: bytes, buffer, offset: int = 0) -> None:
+        """Write the NAND page for data to a writable buffer at offset
+
+        data can be any bytes-like object. Only a too short page is copied
+        to add the necessary padding.
+        """
+        if len(data) > self.__page_size:
+            raise ValueError("data larger than page size")
+
         if len(data) < self.__page_size:
             needed_padding = self.__page_size - len(data)
-            data += b"\x00" * needed_padding
+            data = bytes(data) + b"\x00" * needed_padding
 
-        self.__data = self.__prepare_qca_page(data)
+        out = memoryview(buffer)
 
-        return self.__data
+        if self.__skip_erased and self.__is_erased(data):
+            out[offset : offset + self.size] = self.__erased_page
+            return
+
+        self.__prepare_qca_page(memoryview(data), out, offset)
+
+    def __is_erased(self, data) -> bool:
+        # comparing memoryviews is much slower than comparing bytes
+        if not isinstance(data, bytes):
+            data = bytes(data)
+
+        return data == self.__erased_data
+
+    def program_many(self, data: bytes) -> bytes:
+        """Convert multiple consecutive pages at once
+
+        The ECC of all chunks is calculated in a single batch when numpy is
+        available. The last page is padded like in program().
+        """
+        page_count = math.ceil(len(data) / self.__page_size)
+        pages = bytearray(page_count * self.size)
+        self.program_many_into(data, pages)
+
+        result = bytes(pages)
+        self.__data = result
+
+        return result
+
+    def program_many_into(self, data: bytes, buffer, offset: int = 0) -> None:
+        """Write the NAND pages for multiple consecutive pages to a buffer"""
+        page_count = math.ceil(len(data) / self.__page_size)
+        if page_count == 0:
+            return
+
+        if not available(np):
+            data_view = memoryview(data)
+            for i in range(page_count):
+                start = i * self.__page_size
+                page_data = data_view[start : start + self.__page_size]
+                self.program_into(page_data, buffer, offset + i * self.size)
+
+            return
+
+        # raw pages padded with 0x00
+        raw = np.zeros(page_count * self.__page_size, dtype=np.uint8)
+        raw[: len(data)] = np.frombuffer(data, dtype=np.uint8)
+        raw = raw.reshape(page_count, self.__page_size)
+
+        out = np.frombuffer(
+            buffer, dtype=np.uint8, count=page_count * self.size, offset=offset
+        )
+        out = out.reshape(page_count, self.size)
+
+        if self.__skip_erased:
+            erased = (raw == 0xFF).all(axis=1)
+            if erased.any():
+                out[erased] = 0xFF
+
+                programmed = ~erased
+                raw = raw[programmed]
+                pages = np.empty((len(raw), self.size), dtype=np.uint8)
+                self.__program_batch(raw, pages)
+                out[programmed] = pages
+                return
+
+        self.__program_batch(raw, out)
+
+    def __program_batch(self, raw: "np.ndarray", out: "np.ndarray") -> None:
+        layout = self.__get_layout()
+        stats_hook = self.__stats_hook
+        if stats_hook is None:
+            chunks = layout.chunk_data(raw)
+            ecc = self.__ecc_codec.encode_many(chunks)
+            layout.pagify(raw, ecc, out)
+            return
+
+        start = time.perf_counter()
+        chunks = layout.chunk_data(raw)
+        chunked = time.perf_counter()
+        ecc = self.__ecc_codec.encode_many(chunks)
+        encoded = time.perf_counter()
+        layout.pagify(raw, ecc, out)
+        end = time.perf_counter()
+
+        stats_hook("encode", encoded - chunked, chunks.nbytes)
+        stats_hook("layout", (chunked - start) + (end - encoded), out.nbytes)
 
-    def __prepare_qca_page(self, data) -> bytes:
-        page_parts = []
+    def unprogram(self, data: bytes) -> bytes:
+        """Extract the raw page data from a NAND page
+
+        BBM, ECC and padding are removed. The data is not checked or
+        corrected with the ECC.
+        """
+        if len(data) != self.size:
+            raise ValueError("NAND page has invalid size")
+
+        chunk_size = self.__chunk.size
+        no_chunks = math.ceil(self.__page_size / self.__chunk.data_size)
+
+        parts = []
+        for i in range(0, no_chunks * chunk_size, chunk_size):
+            parts.append(self.__chunk.unprogram(data[i : i + chunk_size]))
+
+        return b"".join(parts)[: self.__page_size]
+
+    def unprogram_many(self, data: bytes) -> bytes:
+        """Extract the raw page data from multiple consecutive NAND pages"""
+        if len(data) % self.size != 0:
+            raise ValueError("NAND pages have invalid size")
+
+        page_count = len(data) // self.size
+
+        if not available(np):
+            data_view = memoryview(data)
+            return b"".join(
+                self.unprogram(data_view[i * self.size : (i + 1) * self.size])
+                for i in range(page_count)
+            )
+
+        pages = np.frombuffer(data, dtype=np.uint8)
+        pages = pages.reshape(page_count, self.size)
+
+        return self.__get_layout().depagify(pages).tobytes()
+
+    def verify_many(self, data: bytes) -> Tuple[List[int], bytes]:
+        """Check and correct the chunks of multiple consecutive NAND pages
+
+        The number of corrected bitflips of each chunk (-1 for uncorrectable
+        chunks) is returned together with the corrected NAND pages. Erased
+        chunks are accepted when they have at most "strength" bitflips.
+        numpy is required for the verification.
+        """
+        if not available(np):
+            raise ImportError("numpy is required for the verification")
+
+        if len(data) % self.size != 0:
+            raise ValueError("NAND pages have invalid size")
+
+        page_count = len(data) // self.size
+        layout = self.__get_layout()
+
+        pages = np.frombuffer(data, dtype=np.uint8)
+        pages = pages.reshape(page_count, self.size)
+        chunks, stored_ecc = layout.split_chunks(pages)
+
+        ecc = self.__ecc_codec.encode_many(chunks)
+        failed = np.flatnonzero((ecc != stored_ecc).any(axis=1))
+
+        bitflips = [0] * len(chunks)
+        if len(failed) == 0:
+            return bitflips, bytes(data)
+
+        strength = self.__ecc_codec.strength
+        for row in failed:
+            chunk_data = chunks[row].tobytes()
+            chunk_ecc = stored_ecc[row].tobytes()
+            codeword = chunk_data + chunk_ecc
+
+            # erased chunks have no valid ECC
+            erased_bitflips = len(codeword) * 8 - _popcount(codeword)
+            if erased_bitflips == 0:
+                continue
+
+            flips, fixed_data, fixed_ecc = self.__ecc_codec.correct(
+                chunk_data, chunk_ecc
+            )
+            if flips < 0 and erased_bitflips <= strength:
+                flips = erased_bitflips
+                fixed_data = b"\xff" * len(chunk_data)
+                fixed_ecc = b"\xff" * len(chunk_ecc)
+
+            bitflips[row] = flips
+            if flips > 0:
+                chunks[row] = np.frombuffer(fixed_data, dtype=np.uint8)
+                stored_ecc[row] = np.frombuffer(fixed_ecc, dtype=np.uint8)
+
+        corrected = pages.copy()
+        layout.merge_chunks(chunks, stored_ecc, corrected)
+
+        return bitflips, corrected.tobytes()
+
+    def __get_layout(self) -> PageLayout:
+        if self.__layout is None:
+            self.__layout = PageLayout(
+                self.__chunk, self.__page_size, self.__oob_size
+            )
+
+        return self.__layout
+
+    def __prepare_qca_page(self, data, out, offset: int) -> None:
+        chunk_data_size = self.__chunk.data_size
+        chunk_size = self.__chunk.size
 
         # split data in smaller portions and convert it to chunks
-        page_size = 0
-        for i in range(0, len(data), self.__chunk.data_size):
-            chunk_data = data[i : i + self.__chunk.data_size]
-            self.__chunk.program(chunk_data)
-            page_parts.append(self.__chunk.data)
-            page_size += self.__chunk.size
+        pos = offset
+        for i in range(0, self.__page_size, chunk_data_size):
+            chunk_data = data[i : i + chunk_data_size]
+            self.__chunk.program_into(chunk_data, out, pos)
+            pos += chunk_size
 
         # ensure that the page is completely filled
-        if page_size < self.__page_size + self.__oob_size:
-            needed_padding = self.__page_size + self.__oob_size - page_size
-            page_parts.append(b"\xff" * needed_padding)
-
-        return b"".join(page_parts)
+        out[pos : offset + self.size] = self.__page_fill
 
     @property
     def data(self) -> bytes:
         return self.__data
+
+    @property
+    def ecc_cache(self) -> Optional[EccCache]:
+        if isinstance(self.__ecc_codec, EccCache):
+            return self.__ecc_codec
+
+        return None
+
+    @property
+    def ecc_disk_cache(self) -> Optional[EccDiskCache]:
+        return self.__disk_cache
+
+    @property
+    def size(self) -> int:
+        return self.__page_size + self.__oob_size
+
+    @property
+    def data_size(self) -> int:
+        return self.__page_size
+
+    @property
+    def chunk(self) -> Chunk:
+        return self.__chunk
+
+    @property
+    def chunk_data_size(self) -> int:
+        return self.__chunk.data_size
@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+__all__ = [
+    "ConversionStats",
+    "StageHook",
+    "StageStats",
+]
+
+# called with stage name, seconds and processed bytes after each operation
+StageHook = Callable[[str, float, int], None]
+
+
+@dataclass
+class StageStats:
+    # cumulative time spent in the stage
+    seconds: float = 0.0
+    # number of operations of the stage
+    calls: int = 0
+    # number of bytes processed by the stage
+    size: int = 0
+
+
+class ConversionStats:
+    """Collect cumulative per-stage statistics of a conversion
+
+    An instance is used as StageHook. The stages of the conversion are
+    "read", "encode" (ECC calculation), "layout" (assembling chunks and
+    pages) and "write". The hook can be called from multiple threads.
+
+    The wall clock time starts with start() or otherwise at the beginning
+    of the first reported operation.
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__stages: Dict[str, StageStats] = {}
+        self.__start: Optional[float] = None
+        self.__end: Optional[float] = None
+
+    def __call__(self, stage: str, seconds: float, size: int) -> None:
+        with self.__lock:
+            if self.__start is None:
+                self.__start = time.perf_counter() - seconds
+
+            stats = self.__stages.get(stage)
+            if stats is None:
+                stats = StageStats()
+                self.__stages[stage] = stats
+
+            stats.seconds += seconds
+            stats.calls += 1
+            stats.size += size
+
+    def start(self) -> None:
+        """Start the wall clock time of the conversion"""
+        with self.__lock:
+            self.__start = time.perf_counter()
+
+    def stop(self) -> None:
+        """Stop the wall clock time of the conversion"""
+        self.__end = time.perf_counter()
+
+    @property
+    def stages(self) -> Dict[str, StageStats]:
+        return self.__stages
+
+    @property
+    def elapsed(self) -> float:
+        if self.__start is None:
+            return 0.0
+
+        end = self.__end
+        if end is None:
+            end = time.perf_counter()
+
+        return end - self.__start
+
+    def format(self, pages: int) -> List[str]:
+        """Human readable report of all stages and the page throughput"""
+        elapsed = self.elapsed
+        lines = []
+
+        for name, stats in self.__stages.items():
+            share = 0.0
+            if elapsed > 0:
+                share = stats.seconds / elapsed * 100
+
+            throughput = 0.0
+            if stats.seconds > 0:
+                throughput = stats.size / 1024**2 / stats.seconds
+
+            lines.append(
+                f"{name}: {stats.seconds:.3f} s ({share:.1f}%), "
+                f"{stats.calls} calls, {stats.size / 1024**2:.2f} MB, "
+                f"{throughput:.2f} MB/s"
+            )
+
+        pages_per_s = pages / elapsed if elapsed > 0 else 0.0
+        lines.append(
+            f"total: {elapsed:.3f} s, {pages} pages, {pages_per_s:.0f} pages/s"
+        )
+
+        return lines
@@ -0,0 +1,189 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import io
+import math
+from typing import BinaryIO, Iterable, Iterator
+
+from .convert import BATCH_PAGES, PageConfig, PagifySummary
+
+__all__ = [
+    "PagifyReader",
+    "PagifyWriter",
+    "iter_pages",
+]
+
+
+def iter_pages(
+    data: Iterable[bytes],
+    config: PageConfig,
+    batch_pages: int = BATCH_PAGES,
+) -> Iterator[bytes]:
+    """Convert arbitrary sized blocks of a raw image to NAND pages
+
+    The NAND pages are yielded one by one. At most batch_pages pages are
+    buffered - the last page is padded like in Page.program().
+    """
+    nand_page_size = config.nand_page_size
+    batch_size = config.page_size * batch_pages
+    buffer = bytearray()
+
+    def convert(raw: bytes) -> Iterator[bytes]:
+        nand_pages = memoryview(page.program_many(raw))
+        for i in range(0, len(nand_pages), nand_page_size):
+            yield bytes(nand_pages[i : i + nand_page_size])
+
+    with config.create_page() as page:
+        for block in data:
+            buffer += block
+            while len(buffer) >= batch_size:
+                raw = bytes(buffer[:batch_size])
+                del buffer[:batch_size]
+                yield from convert(raw)
+
+        if buffer:
+            yield from convert(bytes(buffer))
+
+
+class PagifyWriter(io.RawIOBase):
+    """Writable stream which converts a raw image to NAND pages
+
+    Writes of any size are accepted. Complete batches of pages are converted
+    and written to the underlying stream. The remaining partial page is
+    padded and written on close(). The underlying stream is not closed.
+    """
+
+    def __init__(
+        self,
+        data_out: BinaryIO,
+        config: PageConfig,
+        batch_pages: int = BATCH_PAGES,
+    ) -> None:
+        super().__init__()
+
+        self.__data_out = data_out
+        self.__page = config.create_page()
+        self.__batch_size = config.page_size * batch_pages
+        self.__page_size = config.page_size
+        self.__buffer = bytearray()
+        self.__summary = PagifySummary()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed file")
+
+        with memoryview(data) as view:
+            size = view.nbytes
+            self.__buffer += view
+
+        while len(self.__buffer) >= self.__batch_size:
+            self.__convert(self.__batch_size)
+
+        return size
+
+    def __convert(self, size: int) -> None:
+        raw = bytes(self.__buffer[:size])
+        del self.__buffer[:size]
+
+        self.__data_out.write(self.__page.program_many(raw))
+
+        pages = math.ceil(len(raw) / self.__page_size)
+        self.__summary.pages += pages
+        self.__summary.encoded_pages += pages
+
+    def flush(self) -> None:
+        """Write all complete pages and flush the underlying stream
+
+        The remaining partial page is only written on close().
+        """
+        if not self.closed:
+            full_pages = len(self.__buffer) // self.__page_size
+            if full_pages > 0:
+                self.__convert(full_pages * self.__page_size)
+
+            self.__data_out.flush()
+
+        super().flush()
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                if self.__buffer:
+                    self.__convert(len(self.__buffer))
+
+                self.__data_out.flush()
+            finally:
+                self.__page.close()
+
+        super().close()
+
+    @property
+    def summary(self) -> PagifySummary:
+        return self.__summary
+
+
+class PagifyReader(io.RawIOBase):
+    """Readable stream of NAND pages for a raw image stream
+
+    The raw image is read in batches of pages from the underlying stream
+    and converted on demand. The underlying stream is not closed.
+    """
+
+    def __init__(
+        self,
+        data_in: BinaryIO,
+        config: PageConfig,
+        batch_pages: int = BATCH_PAGES,
+    ) -> None:
+        super().__init__()
+
+        self.__data_in = data_in
+        self.__page = config.create_page()
+        self.__batch_size = config.page_size * batch_pages
+        self.__buffer = b""
+        self.__pos = 0
+        self.__eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        if not self.closed:
+            self.__page.close()
+
+        super().close()
+
+    def __fill(self) -> None:
+        raw = bytearray()
+
+        # underlying streams may return less data than requested
+        while len(raw) < self.__batch_size:
+            data = self.__data_in.read(self.__batch_size - len(raw))
+            if not data:
+                self.__eof = True
+                break
+
+            raw += data
+
+        self.__buffer = self.__page.program_many(bytes(raw))
+        self.__pos = 0
+
+    def readinto(self, buffer) -> int:
+        if self.closed:
+            raise ValueError("read from closed file")
+
+        if self.__pos >= len(self.__buffer):
+            if self.__eof:
+                return 0
+
+            self.__fill()
+
+        with memoryview(buffer) as view:
+            size = min(len(view), len(self.__buffer) - self.__pos)
+            view[:size] = self.__buffer[self.__pos : self.__pos + size]
+
+        self.__pos += size
+        return size
@@ -0,0 +1,19 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import random
+from typing import Optional
+
+
+def random_bytes(size: int, rand: Optional[random.Random] = None) -> bytes:
+    """Pseudo random test data (same as random.Random.randbytes)
+
+    Without a generator, the data is taken from random.Random(1).
+    """
+    if rand is None:
+        rand = random.Random(1)
+
+    if size == 0:
+        return b""
+
+    return rand.getrandbits(8 * size).to_bytes(size, "little")
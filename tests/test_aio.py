@@ -0,0 +1,144 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import asyncio
+import concurrent.futures
+import gc
+import io
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from src.qcom_nandc_pagify import EccType, PageConfig, pagify, pagify_stream
+from tests.helpers import random_bytes
+
+
+class BytesStreamWriter:
+    def __init__(self):
+        self.data = io.BytesIO()
+        self.drains = 0
+
+    def write(self, data):
+        self.data.write(data)
+
+    async def drain(self):
+        self.drains += 1
+
+
+class PagifyStreamTestCase(TestCase):
+    def test_stream(self):
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.BCH4)
+        input_data = random_bytes(2048 * 20 + 100)
+
+        expected = io.BytesIO()
+        pagify(io.BytesIO(input_data), expected, config)
+
+        async def convert(**kwargs):
+            reader = asyncio.StreamReader()
+            for i in range(0, len(input_data), 3000):
+                reader.feed_data(input_data[i : i + 3000])
+            reader.feed_eof()
+
+            writer = BytesStreamWriter()
+            summary = await pagify_stream(
+                reader, writer, config, batch_pages=4, **kwargs
+            )
+
+            return summary, writer
+
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            variants = [{}, {"jobs": 2}, {"executor": executor, "jobs": 2}]
+            for kwargs in variants:
+                with self.subTest(f"Testing {kwargs}"):
+                    summary, writer = asyncio.run(convert(**kwargs))
+
+                    self.assertEqual(
+                        writer.data.getvalue(), expected.getvalue()
+                    )
+                    self.assertEqual(summary.pages, 21)
+                    self.assertEqual(writer.drains, 6)
+
+    def test_cache_file_closed(self):
+        input_data = random_bytes(2048 * 8)
+
+        async def convert(config, **kwargs):
+            reader = asyncio.StreamReader()
+            reader.feed_data(input_data)
+            reader.feed_eof()
+
+            await pagify_stream(
+                reader, BytesStreamWriter(), config, batch_pages=2, **kwargs
+            )
+
+        executors = [
+            None,
+            concurrent.futures.ThreadPoolExecutor(2),
+            concurrent.futures.ProcessPoolExecutor(2),
+        ]
+        for executor in executors:
+            name = f"Testing {type(executor).__name__}"
+            with self.subTest(name), tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "ecc.sqlite")
+                config = PageConfig(
+                    ecc=EccType.RS, ecc_cache_file=path, ecc_backend="table"
+                )
+
+                asyncio.run(convert(config, executor=executor, jobs=2))
+                if executor is not None:
+                    executor.shutdown()
+
+                # the WAL is only removed by the last closed connection
+                self.assertTrue(os.path.exists(path))
+                self.assertFalse(os.path.exists(path + "-wal"))
+
+    def test_error(self):
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.BCH4)
+        input_data = random_bytes(2048 * 20)
+
+        def fail(delay):
+            time.sleep(delay)
+            raise ValueError("conversion failed")
+
+        class FailingExecutor(concurrent.futures.ThreadPoolExecutor):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.delays = iter([0.1])
+
+            def submit(self, fn, *args, **kwargs):
+                # the second batch fails before the first one
+                return super().submit(fail, next(self.delays, 0.0))
+
+        async def convert(executor):
+            errors = []
+            loop = asyncio.get_running_loop()
+            loop.set_exception_handler(
+                lambda loop, context: errors.append(context)
+            )
+
+            reader = asyncio.StreamReader()
+            reader.feed_data(input_data)
+            reader.feed_eof()
+
+            # the traceback must not keep the futures alive
+            failed = False
+            try:
+                await pagify_stream(
+                    reader,
+                    BytesStreamWriter(),
+                    config,
+                    executor=executor,
+                    jobs=2,
+                    batch_pages=4,
+                )
+            except ValueError:
+                failed = True
+
+            # unretrieved exceptions are only reported on garbage collection
+            gc.collect()
+            await asyncio.sleep(0)
+
+            return failed, errors
+
+        with FailingExecutor(2) as executor:
+            self.assertEqual(asyncio.run(convert(executor)), (True, []))
@@ -0,0 +1,582 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import io
+import math
+import os
+import random
+import tempfile
+import time
+from unittest import TestCase, skipIf
+
+from src.qcom_nandc_pagify import (
+    ConversionStats,
+    EccType,
+    PageConfig,
+    depagify,
+    pad_erased,
+    pagify,
+    pagify_incremental,
+    pagify_mmap,
+    pagify_pipeline,
+    pagify_range,
+    verify,
+)
+from tests.helpers import random_bytes
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class PagifyTestCase(TestCase):
+    def test_jobs(self):
+        input_data = random_bytes(2048 * 40 + 100)
+
+        for ecc in EccType:
+            with self.subTest(f"Testing {ecc}"):
+                config = PageConfig(page_size=2048, oob_size=128, ecc=ecc)
+                page = config.create_page()
+
+                expected = b"".join(
+                    page.program(input_data[i : i + 2048])
+                    for i in range(0, len(input_data), 2048)
+                )
+
+                for jobs, threads in [(1, False), (3, False), (3, True)]:
+                    data_out = io.BytesIO()
+                    pagify(
+                        io.BytesIO(input_data),
+                        data_out,
+                        config,
+                        jobs=jobs,
+                        batch_pages=4,
+                        threads=threads,
+                    )
+                    self.assertEqual(data_out.getvalue(), expected)
+
+    def test_runs(self):
+        rand = random.Random(1)
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.RS)
+        page = config.create_page()
+
+        page_a, page_b, page_c = (random_bytes(2048, rand) for _ in range(3))
+        input_pages = [page_a, page_a, page_a, page_b, page_c, page_c]
+        expected = b"".join(page.program(p) for p in input_pages)
+
+        for jobs, encoded_pages in [(1, 3), (2, 4)]:
+            with self.subTest(f"Testing {jobs} jobs"):
+                data_out = io.BytesIO()
+                summary = pagify(
+                    io.BytesIO(b"".join(input_pages)),
+                    data_out,
+                    config,
+                    jobs=jobs,
+                    batch_pages=2,
+                )
+
+                self.assertEqual(data_out.getvalue(), expected)
+                self.assertEqual(summary.pages, 6)
+                self.assertEqual(summary.encoded_pages, encoded_pages)
+                self.assertEqual(summary.runs, 2)
+                self.assertEqual(summary.repeated_pages, 3)
+
+    def test_invalid_config(self):
+        configs = [
+            PageConfig(page_size=2048, oob_size=32, ecc=EccType.BCH8),
+            PageConfig(ecc_backend="unknown"),
+            PageConfig(ecc=EccType.RS, ecc_backend="bchlib"),
+        ]
+
+        for config in configs:
+            with self.subTest(f"Testing {config}"):
+                self.assertRaises(ValueError, config.validate)
+                self.assertRaises(
+                    ValueError,
+                    pagify,
+                    io.BytesIO(b""),
+                    io.BytesIO(),
+                    config,
+                    jobs=2,
+                )
+
+    def test_cache_counters(self):
+        config = PageConfig(
+            page_size=2048, oob_size=64, ecc=EccType.RS, ecc_cache_size=100
+        )
+        input_data = random_bytes(2048 * 2) * 3
+
+        summary = pagify(io.BytesIO(input_data), io.BytesIO(), config)
+
+        self.assertEqual(summary.ecc_cache_misses, 8)
+        self.assertEqual(summary.ecc_cache_hits, 16)
+
+    def test_cache_file_closed(self):
+        input_data = random_bytes(2048 * 8)
+
+        for threads in [False, True]:
+            name = f"Testing threads={threads}"
+            with self.subTest(name), tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "ecc.sqlite")
+                config = PageConfig(
+                    ecc=EccType.RS,
+                    ecc_cache_file=path,
+                    ecc_backend="table",
+                )
+
+                pagify(
+                    io.BytesIO(input_data),
+                    io.BytesIO(),
+                    config,
+                    jobs=2,
+                    batch_pages=2,
+                    threads=threads,
+                )
+
+                # the WAL is only removed by the last closed connection
+                self.assertTrue(os.path.exists(path))
+                self.assertFalse(os.path.exists(path + "-wal"))
+
+    def test_depagify(self):
+        input_data = random_bytes(2048 * 40)
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.BCH4)
+
+        data_out = io.BytesIO()
+        pagify(io.BytesIO(input_data), data_out, config)
+
+        raw_out = io.BytesIO()
+        summary = depagify(
+            io.BytesIO(data_out.getvalue()), raw_out, config, batch_pages=3
+        )
+
+        self.assertEqual(raw_out.getvalue(), input_data)
+        self.assertEqual(summary.pages, 40)
+
+        self.assertRaises(
+            ValueError,
+            depagify,
+            io.BytesIO(data_out.getvalue()[:-1]),
+            io.BytesIO(),
+            config,
+        )
+
+    def test_mmap(self):
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.RS)
+
+        for size in [0, 2048 * 10, 2048 * 40 + 100]:
+            input_data = random_bytes(size)
+
+            data_out = io.BytesIO()
+            pagify(io.BytesIO(input_data), data_out, config)
+            expected = data_out.getvalue()
+
+            for jobs in [1, 3]:
+                name = f"Testing {size} bytes with {jobs} jobs"
+                with self.subTest(name), tempfile.TemporaryDirectory() as tmp:
+                    infile = os.path.join(tmp, "in.bin")
+                    outfile = os.path.join(tmp, "out.bin")
+                    with open(infile, "wb") as in_file:
+                        in_file.write(input_data)
+
+                    pagify_mmap(
+                        infile, outfile, config, jobs=jobs, batch_pages=4
+                    )
+
+                    with open(outfile, "rb") as out_file:
+                        self.assertEqual(out_file.read(), expected)
+
+    def test_incremental(self):
+        rand = random.Random(1)
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.BCH4)
+
+        input_data = bytearray(random_bytes(2048 * 40 + 100, rand))
+        changes = [
+            # initial conversion
+            (None, 41),
+            # no changes
+            (None, 0),
+            # two changed pages in different batches
+            (10, 1),
+            (30, 1),
+            # larger image with changed (previously) last page
+            (2048 * 41 + 10, 2),
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            infile = os.path.join(tmp, "in.bin")
+            outfile = os.path.join(tmp, "out.bin")
+
+            for change, encoded_pages in changes:
+                if change is not None and change < 2048 * 40:
+                    input_data[change * 2048] ^= 0xFF
+                elif change is not None:
+                    input_data += random_bytes(change - len(input_data), rand)
+
+                with self.subTest(f"Testing change {change}"):
+                    with open(infile, "wb") as in_file:
+                        in_file.write(input_data)
+
+                    summary = pagify_incremental(
+                        infile, outfile, config, batch_pages=8
+                    )
+                    self.assertEqual(summary.encoded_pages, encoded_pages)
+
+                    expected = io.BytesIO()
+                    pagify(io.BytesIO(input_data), expected, config)
+                    with open(outfile, "rb") as out_file:
+                        self.assertEqual(out_file.read(), expected.getvalue())
+
+            # a smaller image truncates the output
+            del input_data[2048 * 20 :]
+            with open(infile, "wb") as in_file:
+                in_file.write(input_data)
+
+            summary = pagify_incremental(infile, outfile, config)
+            self.assertEqual(summary.pages, 20)
+            self.assertEqual(summary.encoded_pages, 0)
+            self.assertEqual(os.path.getsize(outfile), 2112 * 20)
+
+            # other parameters force a complete conversion
+            config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.RS)
+            summary = pagify_incremental(infile, outfile, config)
+            self.assertEqual(summary.encoded_pages, 20)
+
+    def test_incremental_output(self):
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.BCH4)
+        input_data = random_bytes(2048 * 10)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            infile = os.path.join(tmp, "in.bin")
+            outfile = os.path.join(tmp, "out.bin")
+
+            with open(infile, "wb") as in_file:
+                in_file.write(input_data)
+
+            pagify_incremental(infile, outfile, config)
+
+            # output of another conversion must not be patched
+            with open(infile, "rb") as data_in, open(
+                outfile, "wb"
+            ) as data_out:
+                pagify(data_in, data_out, config)
+                pad_erased(data_out, config, 2)
+
+            summary = pagify_incremental(infile, outfile, config)
+            self.assertEqual(summary.encoded_pages, 10)
+            self.assertEqual(os.path.getsize(outfile), 2112 * 10)
+
+    def test_incremental_padding(self):
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.BCH4)
+        input_data = bytearray(random_bytes(2048 * 10))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            infile = os.path.join(tmp, "in.bin")
+            outfile = os.path.join(tmp, "out.bin")
+
+            for pages, pad_pages, change, encoded_pages in [
+                (10, 16, False, 10),
+                # padding is kept
+                (10, 16, False, 0),
+                (10, 16, True, 1),
+                # padding replaces the pages of a larger image
+                (8, 16, False, 0),
+                (8, 12, False, 0),
+                (8, None, False, 0),
+                (10, 12, False, 2),
+            ]:
+                with self.subTest(f"Testing {pages} pages to {pad_pages}"):
+                    if change:
+                        input_data[0] ^= 0xFF
+
+                    with open(infile, "wb") as in_file:
+                        in_file.write(input_data[: 2048 * pages])
+
+                    summary = pagify_incremental(
+                        infile, outfile, config, pad_pages=pad_pages
+                    )
+                    self.assertEqual(summary.pages, pages)
+                    self.assertEqual(summary.encoded_pages, encoded_pages)
+
+                    expected = io.BytesIO()
+                    pagify(
+                        io.BytesIO(input_data[: 2048 * pages]),
+                        expected,
+                        config,
+                    )
+                    if pad_pages is not None:
+                        pad_erased(expected, config, pad_pages - pages)
+
+                    with open(outfile, "rb") as out_file:
+                        self.assertEqual(out_file.read(), expected.getvalue())
+
+            with open(infile, "wb") as in_file:
+                in_file.write(input_data)
+
+            with self.assertRaises(ValueError):
+                pagify_incremental(infile, outfile, config, pad_pages=8)
+
+    def test_range(self):
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.BCH4)
+
+        input_data = random_bytes(2048 * 40 + 100)
+        expected = io.BytesIO()
+        pagify(io.BytesIO(input_data), expected, config)
+        expected = expected.getvalue()
+
+        for start_page, count, end_page in [
+            (0, 5, 5),
+            (10, 20, 30),
+            (35, None, 41),
+        ]:
+            with self.subTest(f"Testing {start_page} + {count} pages"):
+                data_out = io.BytesIO(b"\x00" * len(expected))
+                summary = pagify_range(
+                    io.BytesIO(input_data),
+                    data_out,
+                    config,
+                    start_page,
+                    count,
+                    batch_pages=4,
+                )
+
+                start = start_page * 2112
+                end = end_page * 2112
+                self.assertEqual(summary.pages, end_page - start_page)
+                self.assertEqual(len(data_out.getvalue()), len(expected))
+                self.assertEqual(
+                    data_out.getvalue()[start:end], expected[start:end]
+                )
+                self.assertEqual(
+                    data_out.getvalue()[:start] + data_out.getvalue()[end:],
+                    b"\x00" * (len(expected) - (end - start)),
+                )
+
+    def test_pipeline(self):
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.BCH4)
+
+        for size in [0, 2048, 2048 * 40 + 100]:
+            input_data = random_bytes(size)
+
+            expected = io.BytesIO()
+            pagify(io.BytesIO(input_data), expected, config)
+
+            for buffers in [1, 3]:
+                with self.subTest(f"Testing {size} bytes, {buffers} buffers"):
+                    data_out = io.BytesIO()
+                    summary = pagify_pipeline(
+                        io.BytesIO(input_data),
+                        data_out,
+                        config,
+                        batch_pages=3,
+                        buffers=buffers,
+                    )
+
+                    self.assertEqual(data_out.getvalue(), expected.getvalue())
+                    self.assertEqual(summary.pages, math.ceil(size / 2048))
+
+    def test_stats(self):
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.BCH4)
+        input_data = random_bytes(2048 * 10 + 100)
+        out_size = 11 * config.nand_page_size
+
+        expected = io.BytesIO()
+        pagify(io.BytesIO(input_data), expected, config)
+
+        def run_pagify(data_in, data_out, stats_hook, jobs=1):
+            return pagify(
+                data_in,
+                data_out,
+                config,
+                jobs=jobs,
+                batch_pages=4,
+                stats_hook=stats_hook,
+            )
+
+        def run_threads(data_in, data_out, stats_hook, jobs=1):
+            return pagify(
+                data_in,
+                data_out,
+                config,
+                jobs=jobs,
+                batch_pages=4,
+                threads=True,
+                stats_hook=stats_hook,
+            )
+
+        def run_pipeline(data_in, data_out, stats_hook, jobs=1):
+            return pagify_pipeline(
+                data_in, data_out, config, batch_pages=4, stats_hook=stats_hook
+            )
+
+        for convert, jobs in [
+            (run_pagify, 1),
+            (run_pagify, 2),
+            (run_threads, 2),
+            (run_pipeline, 1),
+        ]:
+            with self.subTest(f"Testing {convert.__name__}, {jobs} jobs"):
+                stats = ConversionStats()
+                self.assertEqual(stats.elapsed, 0.0)
+
+                data_out = io.BytesIO()
+                summary = convert(
+                    io.BytesIO(input_data), data_out, stats, jobs
+                )
+                stats.stop()
+
+                self.assertEqual(data_out.getvalue(), expected.getvalue())
+                self.assertEqual(stats.stages["read"].size, len(input_data))
+                self.assertEqual(stats.stages["write"].size, out_size)
+                self.assertEqual(stats.stages["write"].calls, 3)
+
+                # the stages of worker processes are not collected
+                if convert is run_pagify and jobs > 1:
+                    self.assertNotIn("encode", stats.stages)
+                else:
+                    self.assertGreater(stats.stages["encode"].calls, 0)
+                    self.assertGreater(stats.stages["layout"].size, 0)
+
+                lines = stats.format(summary.pages)
+                self.assertEqual(len(lines), len(stats.stages) + 1)
+                self.assertIn("11 pages", lines[-1])
+
+    def test_stats_clock(self):
+        stats = ConversionStats()
+
+        # the clock starts with the first operation - not at construction
+        time.sleep(0.1)
+        stats("read", 0.01, 2048)
+        stats.stop()
+        self.assertGreaterEqual(stats.elapsed, 0.01)
+        self.assertLess(stats.elapsed, 0.1)
+
+        stats = ConversionStats()
+        stats.start()
+        time.sleep(0.01)
+        stats("read", 0.0, 2048)
+        stats.stop()
+        self.assertGreaterEqual(stats.elapsed, 0.01)
+
+    def test_pipeline_errors(self):
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.RS)
+        input_data = b"\x00" * 2048 * 40
+
+        class FailingWriter(io.BytesIO):
+            def write(self, data):
+                if self.tell() > 2112 * 5:
+                    raise OSError("write failed")
+
+                return super().write(data)
+
+        class FailingReader(io.BytesIO):
+            def readinto(self, buffer):
+                if self.tell() > 2048 * 5:
+                    raise OSError("read failed")
+
+                return super().readinto(buffer)
+
+        for data_in, data_out in [
+            (io.BytesIO(input_data), FailingWriter()),
+            (FailingReader(input_data), io.BytesIO()),
+        ]:
+            with self.subTest(f"Testing {type(data_in)} {type(data_out)}"):
+                self.assertRaises(
+                    OSError,
+                    pagify_pipeline,
+                    data_in,
+                    data_out,
+                    config,
+                    batch_pages=2,
+                )
+
+
+@skipIf(np is None, "numpy not available")
+class VerifyTestCase(TestCase):
+    def test_verify(self):
+        input_data = random_bytes(2048 * 10) + b"\xff" * 2048
+
+        for ecc in EccType:
+            with self.subTest(f"Testing {ecc}"):
+                config = PageConfig(
+                    page_size=2048, oob_size=128, ecc=ecc, skip_erased=True
+                )
+                data_out = io.BytesIO()
+                pagify(io.BytesIO(input_data), data_out, config)
+                expected = data_out.getvalue()
+
+                # 2 bitflips in page 1 (chunk 0), 1 in erased page 10 and
+                # uncorrectable errors in page 5 (chunk 2)
+                image = bytearray(expected)
+                image[2176] ^= 0x81
+                image[2176 * 10 + 100] ^= 0x04
+                for offset in range(2176 * 5 + 1200, 2176 * 5 + 1220):
+                    image[offset] ^= 0x11
+
+                for jobs in [1, 2]:
+                    corrected = io.BytesIO()
+                    summary = verify(
+                        io.BytesIO(image),
+                        config,
+                        corrected,
+                        jobs=jobs,
+                        batch_pages=3,
+                    )
+
+                    self.assertEqual(summary.pages, 11)
+                    self.assertEqual(summary.chunks, 44)
+                    self.assertEqual(summary.corrected_chunks, 2)
+                    self.assertEqual(summary.bitflips, 3)
+                    self.assertEqual(summary.uncorrectable_chunks, 1)
+                    self.assertEqual(
+                        summary.errors, [(1, 0, 2), (5, 2, -1), (10, 0, 1)]
+                    )
+
+                    start, end = 2176 * 5, 2176 * 6
+                    self.assertEqual(
+                        corrected.getvalue()[:start], expected[:start]
+                    )
+                    self.assertEqual(
+                        corrected.getvalue()[start:end], image[start:end]
+                    )
+                    self.assertEqual(
+                        corrected.getvalue()[end:], expected[end:]
+                    )
+
+
+class PadTestCase(TestCase):
+    def test_fill(self):
+        config = PageConfig(page_size=2048, oob_size=64)
+
+        for page_count in [0, 1, 511, 512, 1500]:
+            with self.subTest(f"Testing {page_count} pages"):
+                data_out = io.BytesIO()
+                data_out.write(b"\x00")
+                pad_erased(data_out, config, page_count)
+
+                self.assertEqual(
+                    data_out.getvalue(), b"\x00" + b"\xff" * 2112 * page_count
+                )
+
+    def test_sparse(self):
+        config = PageConfig(page_size=2048, oob_size=64)
+
+        with tempfile.TemporaryFile() as data_out:
+            data_out.write(b"\x00")
+            pad_erased(data_out, config, 1000, sparse=True)
+            data_out.write(b"\x01")
+
+            self.assertEqual(data_out.tell(), 1 + 2112 * 1000 + 1)
+
+    def test_negative(self):
+        config = PageConfig(page_size=2048, oob_size=64)
+
+        for sparse in [False, True]:
+            with self.subTest(f"Testing sparse={sparse}"):
+                data_out = io.BytesIO(b"\x00" * 2112 * 2)
+                data_out.seek(0, io.SEEK_END)
+
+                self.assertRaises(
+                    ValueError, pad_erased, data_out, config, -1, sparse
+                )
+                self.assertEqual(data_out.getvalue(), b"\x00" * 2112 * 2)
@@ -0,0 +1,352 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import concurrent.futures
+import json
+import os
+import random
+import tempfile
+from unittest import TestCase, skipIf
+
+from src.qcom_nandc_pagify import (
+    EccBch,
+    EccCache,
+    EccDiskCache,
+    EccRs,
+    EccType,
+    Page,
+    available_backends,
+    calibrate_backends,
+    calibrated_backend,
+    create_codec,
+    load_calibration,
+)
+from src.qcom_nandc_pagify.ecc import EccMeta
+from tests.helpers import random_bytes
+
+try:
+    import bchlib
+except ImportError:
+    bchlib = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+@skipIf(bchlib is None, "bchlib not available")
+class BchTableTestCase(TestCase):
+    def test_bchlib(self):
+        rand = random.Random(1)
+
+        for bits in [4, 8]:
+            with self.subTest(f"Testing BCH{bits}"):
+                reference = EccBch(bits, use_bchlib=True)
+                codec = EccBch(bits, use_bchlib=False)
+
+                for size in [0, 1, 512, 516]:
+                    chunks = [
+                        b"\x00" * size,
+                        b"\xff" * size,
+                        *[random_bytes(size, rand) for _ in range(30)],
+                    ]
+                    for chunk in chunks:
+                        self.assertEqual(
+                            codec.encode(chunk), reference.encode(chunk)
+                        )
+
+
+def flip_bits(rand, data, count, bits=None):
+    if bits is None:
+        bits = len(data) * 8
+
+    data = bytearray(data)
+    for bit in rand.sample(range(bits), count):
+        data[bit // 8] ^= 0x80 >> (bit % 8)
+
+    return bytes(data)
+
+
+class ThreadTestCase(TestCase):
+    def test_threads(self):
+        rand = random.Random(1)
+        chunks = [random_bytes(516, rand) for _ in range(200)]
+
+        for codec in [EccRs(), EccBch(4), EccBch(8)]:
+            with self.subTest(f"Testing {codec}"):
+                expected = [codec.encode(chunk) for chunk in chunks]
+
+                with concurrent.futures.ThreadPoolExecutor(8) as executor:
+                    results = list(executor.map(codec.encode, chunks * 4))
+
+                self.assertEqual(results, expected * 4)
+
+
+class CorrectTestCase(TestCase):
+    def test_correct(self):
+        rand = random.Random(1)
+        codecs = [
+            ("RS", EccRs(), 4, 80),
+            ("BCH4", EccBch(4, use_bchlib=False), 4, 52),
+            ("BCH8", EccBch(8, use_bchlib=False), 8, 104),
+        ]
+
+        for name, codec, strength, ecc_bits in codecs:
+            with self.subTest(f"Testing {name}"):
+                self.assertEqual(codec.strength, strength)
+
+                for _ in range(20):
+                    data = random_bytes(516, rand)
+                    ecc = codec.encode(data)
+
+                    # the BCH ECC padding bits are not protected
+                    count = rand.randint(0, strength)
+                    codeword = flip_bits(
+                        rand, data + ecc, count, 516 * 8 + ecc_bits
+                    )
+
+                    result = codec.correct(codeword[:516], codeword[516:])
+                    self.assertEqual(result, (count, data, ecc))
+
+                data = random_bytes(516, rand)
+                ecc = codec.encode(data)
+                codeword = flip_bits(rand, data, 3 * strength)
+                self.assertEqual(
+                    codec.correct(codeword, ecc), (-1, codeword, ecc)
+                )
+
+
+class EccMetaTestCase(TestCase):
+    def test_encode_only(self):
+        class EccXor(EccMeta):
+            def encode(self, data: bytes) -> bytes:
+                checksum = 0
+                for byte in data:
+                    checksum ^= byte
+                return bytes([checksum])
+
+            @property
+            def size(self) -> int:
+                return 1
+
+        codec = EccXor()
+        self.assertEqual(codec.encode(b"\x01\x02"), b"\x03")
+
+        with self.assertRaises(NotImplementedError):
+            codec.correct(b"\x01\x02", b"\x03")
+
+        with self.assertRaises(NotImplementedError):
+            codec.strength  # noqa: B018
+
+
+@skipIf(np is None, "numpy not available")
+class EncodeManyTestCase(TestCase):
+    def test_rs(self):
+        rand = random.Random(1)
+        codec = EccRs()
+
+        for size in [512, 516]:
+            with self.subTest(f"Testing RS with {size} bytes"):
+                chunks = [
+                    b"\x00" * size,
+                    b"\xff" * size,
+                    *[random_bytes(size, rand) for _ in range(30)],
+                ]
+                data = np.frombuffer(b"".join(chunks), dtype=np.uint8)
+                ecc = codec.encode_many(data.reshape(len(chunks), size))
+
+                self.assertEqual(ecc.shape, (len(chunks), codec.size))
+                for chunk, chunk_ecc in zip(chunks, ecc):
+                    self.assertEqual(chunk_ecc.tobytes(), codec.encode(chunk))
+
+    def test_bch(self):
+        rand = random.Random(1)
+
+        for bits in [4, 8]:
+            with self.subTest(f"Testing BCH{bits}"):
+                codec = EccBch(bits)
+
+                chunks = [
+                    b"\x00" * 516,
+                    b"\xff" * 516,
+                    *[random_bytes(516, rand) for _ in range(30)],
+                ]
+                data = np.frombuffer(b"".join(chunks), dtype=np.uint8)
+                ecc = codec.encode_many(data.reshape(len(chunks), 516))
+
+                self.assertEqual(ecc.shape, (len(chunks), codec.size))
+                for chunk, chunk_ecc in zip(chunks, ecc):
+                    self.assertEqual(chunk_ecc.tobytes(), codec.encode(chunk))
+
+
+class EccCacheTestCase(TestCase):
+    def test_encode(self):
+        rand = random.Random(1)
+        chunks = [random_bytes(516, rand) for _ in range(4)]
+
+        codec = EccRs()
+        cache = EccCache(codec, 3)
+
+        for chunk in [*chunks[:3], chunks[0], chunks[3], chunks[1]]:
+            self.assertEqual(cache.encode(chunk), codec.encode(chunk))
+
+        # chunk 1 was evicted by chunk 3 because chunk 0 was used again
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 5)
+
+    @skipIf(np is None, "numpy not available")
+    def test_encode_many(self):
+        rand = random.Random(1)
+        chunks = [random_bytes(516, rand) for _ in range(4)]
+        chunks = [*chunks, *chunks[:2], b"\xff" * 516]
+
+        codec = EccBch(4)
+        cache = EccCache(codec, 100)
+        cache.encode(chunks[3])
+
+        data = np.frombuffer(b"".join(chunks), dtype=np.uint8)
+        ecc = cache.encode_many(data.reshape(len(chunks), 516))
+
+        for chunk, chunk_ecc in zip(chunks, ecc):
+            self.assertEqual(chunk_ecc.tobytes(), codec.encode(chunk))
+
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 5)
+
+    @skipIf(np is None, "numpy not available")
+    def test_encode_many_bypass(self):
+        rand = random.Random(1)
+        chunks = [random_bytes(516, rand) for _ in range(8)]
+        batches = [
+            np.frombuffer(b"".join(batch), dtype=np.uint8).reshape(-1, 516)
+            for batch in [chunks[:4], chunks[:4], chunks[:4], chunks[4:]]
+        ]
+
+        codec = EccBch(4)
+        cache = EccCache(codec, 100)
+
+        results = [cache.encode_many(batch) for batch in batches]
+        for batch, ecc in zip(batches, results):
+            np.testing.assert_array_equal(ecc, codec.encode_many(batch))
+
+        # second batch bypassed the cache after the first one had no hit
+        self.assertEqual(cache.hits, 4)
+        self.assertEqual(cache.misses, 12)
+
+
+class EccDiskCacheTestCase(TestCase):
+    def test_encode(self):
+        rand = random.Random(1)
+        chunks = [random_bytes(516, rand) for _ in range(4)]
+        codec = EccRs()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+
+            cache = EccDiskCache(codec, path, "RS", 10)
+            for chunk in chunks:
+                self.assertEqual(cache.encode(chunk), codec.encode(chunk))
+            cache.close()
+
+            self.assertEqual(cache.hits, 0)
+            self.assertEqual(cache.misses, 4)
+
+            # results are shared with later users of the same file
+            cache = EccDiskCache(codec, path, "RS", 10)
+            for chunk in chunks[1:]:
+                self.assertEqual(cache.encode(chunk), codec.encode(chunk))
+            cache.close()
+
+            self.assertEqual(cache.hits, 3)
+            self.assertEqual(cache.misses, 0)
+
+            # other ECC types are stored separately
+            other = EccDiskCache(codec, path, "RS_SBL", 10)
+            other.encode(chunks[3])
+            other.close()
+
+            self.assertEqual(other.hits, 0)
+            self.assertEqual(other.misses, 1)
+
+            # least recently used entries are evicted
+            cache = EccDiskCache(codec, path, "RS", 2)
+            cache.encode(chunks[3])
+            cache.encode(chunks[0])
+            cache.close()
+
+            self.assertEqual(cache.hits, 1)
+            self.assertEqual(cache.misses, 1)
+
+
+@skipIf(np is None, "numpy not available")
+class EccDiskCacheBatchTestCase(TestCase):
+    def test_encode_many(self):
+        rand = random.Random(1)
+        chunks = [random_bytes(516, rand) for _ in range(4)]
+        data = np.frombuffer(b"".join(chunks), dtype=np.uint8)
+        data = data.reshape(len(chunks), 516)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+
+            for use_numpy, lookups in [(False, 4), (True, 0)]:
+                with self.subTest(f"Testing use_numpy={use_numpy}"):
+                    codec = EccRs(use_numpy=use_numpy)
+                    cache = EccDiskCache(codec, path, "RS", 10)
+                    ecc = cache.encode_many(data)
+                    cache.close()
+
+                    # batch encoders are faster than the lookup
+                    np.testing.assert_array_equal(ecc, codec.encode_many(data))
+                    self.assertEqual(cache.batch, use_numpy)
+                    self.assertEqual(cache.hits + cache.misses, lookups)
+
+
+class BackendTestCase(TestCase):
+    def test_backends(self):
+        input_data = random_bytes(2048 * 5 + 100)
+
+        for ecc in EccType:
+            expected = Page(oob_size=128, ecc=ecc).program_many(input_data)
+
+            for backend in available_backends(ecc):
+                with self.subTest(f"Testing {ecc} with {backend}"):
+                    page = Page(oob_size=128, ecc=ecc, ecc_backend=backend)
+                    self.assertEqual(page.program_many(input_data), expected)
+
+    def test_calibrate(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "config", "backends.json")
+            results = calibrate_backends(path, page_count=1, min_time=0)
+
+            calibration = load_calibration(path)
+            for ecc in EccType:
+                self.assertEqual(
+                    set(results[ecc.name]), set(available_backends(ecc))
+                )
+                self.assertIn(calibration[ecc.name], available_backends(ecc))
+
+            codec = create_codec(EccType.RS, calibration_file=path)
+            self.assertEqual(codec.size, 10)
+
+    def test_calibration_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "backends.json")
+            with open(path, "w", encoding="utf-8") as calibration_file:
+                json.dump({"BCH4": "table", "RS": "unknown"}, calibration_file)
+
+            self.assertEqual(calibrated_backend(EccType.BCH4, path), "table")
+            self.assertIsNone(calibrated_backend(EccType.RS, path))
+            self.assertIsNone(calibrated_backend(EccType.BCH8, path))
+
+            codec = create_codec(EccType.BCH4, calibration_file=path)
+            self.assertFalse(codec.batch)
+
+            # the calibration is only used when it is requested
+            codec = create_codec(EccType.BCH4)
+            self.assertEqual(codec.batch, np is not None)
+
+    def test_raise(self):
+        self.assertRaises(ValueError, create_codec, EccType.RS, "unknown")
+        self.assertRaises(ValueError, create_codec, EccType.RS, "bchlib")
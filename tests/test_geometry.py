@@ -0,0 +1,55 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+from unittest import TestCase
+
+from src.qcom_nandc_pagify import EccType, Page, PageGeometry
+from tests.helpers import random_bytes
+
+
+class GeometryTestCase(TestCase):
+    def test_mapping(self):
+        configs = [
+            (2048, 64, False, EccType.BCH4),
+            (2048, 128, True, EccType.BCH8),
+            (4096, 128, False, EccType.RS),
+            (4096, 224, True, EccType.RS_SBL),
+        ]
+
+        for page_size, oob_size, widebus, ecc in configs:
+            with self.subTest(f"Testing {page_size}+{oob_size} {ecc}"):
+                page = Page(page_size, oob_size, widebus=widebus, ecc=ecc)
+                geometry = PageGeometry(page)
+
+                raw = random_bytes(page_size * 2)
+                nand = page.program(raw[:page_size])
+                nand += page.program(raw[page_size:])
+
+                mapped = set()
+                for offset in range(len(raw)):
+                    location = geometry.raw_to_nand(offset)
+                    self.assertEqual(nand[location.offset], raw[offset])
+                    self.assertEqual(location.page, offset // page_size)
+                    self.assertLess(location.chunk, geometry.no_chunks)
+                    self.assertEqual(
+                        location.offset,
+                        geometry.nand_page_offset(location.page)
+                        + location.chunk * page.chunk.size
+                        + location.chunk_offset,
+                    )
+                    mapped.add(location.offset)
+
+                for offset in range(len(nand)):
+                    raw_offset = geometry.nand_to_raw(offset)
+                    if offset not in mapped:
+                        self.assertIsNone(raw_offset)
+                        continue
+
+                    location = geometry.raw_to_nand(raw_offset)
+                    self.assertEqual(location.offset, offset)
+
+    def test_raise(self):
+        geometry = PageGeometry(Page())
+
+        self.assertRaises(ValueError, geometry.raw_to_nand, -1)
+        self.assertRaises(ValueError, geometry.nand_to_raw, -1)
@@ -0,0 +1,166 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import importlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+from traceback import extract_tb
+from unittest import TestCase
+
+import src.qcom_nandc_pagify as package
+from src.qcom_nandc_pagify import EccType, PageConfig, pagify
+from src.qcom_nandc_pagify._lazy import available, optional_module
+from tests.helpers import random_bytes
+
+
+def import_times(code):
+    """Cumulative import time (in us) of all modules imported by code"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+
+    return times
+
+
+def imported(times, module):
+    """Check whether module or one of its submodules was imported"""
+    # importlib.import_module() doesn't report the top-level package itself
+    return any(
+        name == module or name.startswith(f"{module}.") for name in times
+    )
+
+
+class ImportTestCase(TestCase):
+    def test_lazy_imports(self):
+        times = import_times("import src.qcom_nandc_pagify._main")
+
+        self.assertIn("src.qcom_nandc_pagify._main", times)
+        for module in [
+            "asyncio",
+            "bchlib",
+            "concurrent.futures",
+            "numpy",
+            "sqlite3",
+            "src.qcom_nandc_pagify.aio",
+            "src.qcom_nandc_pagify.stream",
+        ]:
+            self.assertFalse(imported(times, module), module)
+
+    def test_lazy_help(self):
+        times = import_times(
+            "import contextlib, io\n"
+            "from src.qcom_nandc_pagify._main import main\n"
+            "with contextlib.redirect_stdout(io.StringIO()):\n"
+            "    try:\n"
+            "        main(['--help'])\n"
+            "    except SystemExit:\n"
+            "        pass\n"
+        )
+
+        self.assertIn("src.qcom_nandc_pagify._main", times)
+        for module in ["bchlib", "numpy", "sqlite3"]:
+            self.assertFalse(imported(times, module), module)
+
+    def test_exports(self):
+        modules = [
+            os.path.splitext(name)[0]
+            for name in os.listdir(os.path.dirname(package.__file__))
+            if name.endswith(".py") and not name.startswith("_")
+        ]
+        self.assertEqual(sorted(package._exports), sorted(modules))
+
+        exported = []
+        for module in modules:
+            submodule = importlib.import_module(f"{package.__name__}.{module}")
+            self.assertEqual(submodule.__all__, package._exports[module])
+
+            for name in submodule.__all__:
+                self.assertIs(getattr(package, name), getattr(submodule, name))
+
+            exported += submodule.__all__
+
+        self.assertEqual(sorted(package.__all__), sorted(exported))
+
+        self.assertRaises(AttributeError, getattr, package, "unknown")
+
+    def test_broken_module(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "broken_module.py"), "w") as module:
+                module.write("raise ImportError('broken installation')\n")
+
+            sys.path.insert(0, tmp)
+            try:
+                broken = optional_module("broken_module")
+                self.assertIsNotNone(broken)
+
+                # the failed import is only tried once
+                for _ in range(100):
+                    self.assertFalse(available(broken))
+
+                # a new exception (without the frames of earlier accesses)
+                # is raised for each access
+                try:
+                    broken.attr  # noqa: B018
+                except ImportError as exc:
+                    self.assertEqual(len(extract_tb(exc.__traceback__)), 3)
+                    self.assertIn("broken installation", str(exc))
+                else:
+                    self.fail("ImportError not raised")
+            finally:
+                sys.path.remove(tmp)
+
+        self.assertIsNone(optional_module("missing_module"))
+        self.assertFalse(available(None))
+        self.assertTrue(available(optional_module("json")))
+
+    def test_broken_numpy(self):
+        config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.BCH4)
+        input_data = random_bytes(2048 * 20 + 100)
+
+        expected = io.BytesIO()
+        pagify(io.BytesIO(input_data), expected, config)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            os.mkdir(os.path.join(tmp, "numpy"))
+            with open(
+                os.path.join(tmp, "numpy", "__init__.py"), "w"
+            ) as module:
+                module.write("raise ImportError('broken installation')\n")
+
+            infile = os.path.join(tmp, "in.bin")
+            with open(infile, "wb") as in_file:
+                in_file.write(input_data)
+
+            # numpy is found but can't be imported by the converters
+            code = (
+                "import sys\n"
+                f"sys.path.insert(0, {tmp!r})\n"
+                "from src.qcom_nandc_pagify import EccType, PageConfig\n"
+                "from src.qcom_nandc_pagify import pagify, pagify_mmap\n"
+                "config = PageConfig(ecc=EccType.BCH4)\n"
+                "pagify_mmap(sys.argv[1], sys.argv[1] + '.mmap', config, "
+                "batch_pages=4)\n"
+                "with open(sys.argv[1], 'rb') as data_in, "
+                "open(sys.argv[1] + '.out', 'wb') as data_out:\n"
+                "    pagify(data_in, data_out, config, batch_pages=4)\n"
+            )
+            subprocess.run([sys.executable, "-c", code, infile], check=True)
+
+            for suffix in [".mmap", ".out"]:
+                with open(infile + suffix, "rb") as out_file:
+                    self.assertEqual(out_file.read(), expected.getvalue())
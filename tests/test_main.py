@@ -0,0 +1,246 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import contextlib
+import io
+import os
+import tempfile
+from unittest import TestCase, skipIf
+
+from src.qcom_nandc_pagify import available_backends
+from src.qcom_nandc_pagify._main import main
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class MainTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.infile = os.path.join(self.tmpdir.name, "in.bin")
+        self.outfile = os.path.join(self.tmpdir.name, "out.bin")
+
+        with open(self.infile, "wb") as in_file:
+            in_file.write(b"\x00" * 2048 * 4)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def assertUsageError(self, args, message):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr), self.assertRaises(
+            SystemExit
+        ) as context:
+            main(args)
+
+        self.assertEqual(context.exception.code, 2)
+        self.assertIn(message, stderr.getvalue())
+
+    def test_missing_infile(self):
+        missing = os.path.join(self.tmpdir.name, "missing.bin")
+
+        for extra in [[], ["--mmap"], ["--incremental"], ["--verify"]]:
+            with self.subTest(f"Testing {extra}"):
+                self.assertUsageError(
+                    ["--infile", missing, "--outfile", self.outfile, *extra],
+                    f"can't open '{missing}'",
+                )
+                self.assertFalse(os.path.exists(self.outfile))
+
+    def test_unwritable_outfile(self):
+        outfile = os.path.join(self.tmpdir.name, "missing", "out.bin")
+
+        self.assertUsageError(
+            ["--infile", self.infile, "--outfile", outfile],
+            f"can't open '{outfile}'",
+        )
+
+    def test_verify_options(self):
+        for extra, option in [
+            (["--start-page", "1"], "--start-page"),
+            (["--outfile", self.outfile, "--start-page", "1"], "--start-page"),
+            (["--mmap"], "--mmap"),
+            (["--pad-to", "16K"], "--pad-to"),
+        ]:
+            with self.subTest(f"Testing {extra}"):
+                self.assertUsageError(
+                    ["--infile", self.infile, "--verify", *extra],
+                    f"--verify cannot be used with {option}",
+                )
+                self.assertFalse(os.path.exists(self.outfile))
+
+    def test_depagify_options(self):
+        for extra, option in [
+            (["--jobs", "2"], "--jobs"),
+            (["--mmap"], "--mmap"),
+            (["--pipeline"], "--pipeline"),
+            (["--pad-to", "16K"], "--pad-to"),
+            (["--start-page", "1"], "--start-page"),
+        ]:
+            with self.subTest(f"Testing {extra}"):
+                self.assertUsageError(
+                    [
+                        "--infile",
+                        self.infile,
+                        "--outfile",
+                        self.outfile,
+                        "--depagify",
+                        *extra,
+                    ],
+                    f"--depagify cannot be used with {option}",
+                )
+                self.assertFalse(os.path.exists(self.outfile))
+
+    def test_truncated_image(self):
+        for extra in [
+            ["--depagify", "--outfile", self.outfile],
+            ["--verify"],
+            ["--verify", "--jobs", "2"],
+        ]:
+            with self.subTest(f"Testing {extra}"):
+                self.assertUsageError(
+                    ["--infile", self.infile, *extra],
+                    "Input doesn't end with a complete NAND page",
+                )
+
+    @skipIf(np is not None, "numpy is installed")
+    def test_verify_without_numpy(self):
+        with open(self.infile, "wb") as in_file:
+            in_file.write(b"\xff" * 2112 * 2)
+
+        for extra in [[], ["--jobs", "2"]]:
+            with self.subTest(f"Testing {extra}"):
+                self.assertUsageError(
+                    ["--infile", self.infile, "--verify", *extra],
+                    "numpy is required for the verification",
+                )
+
+    def test_threads_options(self):
+        for mode, option in [
+            ("--verify", "--threads"),
+            ("--mmap", "--threads"),
+            ("--pipeline", "--jobs"),
+            ("--incremental", "--jobs"),
+        ]:
+            with self.subTest(f"Testing {mode}"):
+                self.assertUsageError(
+                    [
+                        "--infile",
+                        self.infile,
+                        "--outfile",
+                        self.outfile,
+                        "--jobs",
+                        "2",
+                        "--threads",
+                        mode,
+                    ],
+                    f"{mode} cannot be used with {option}",
+                )
+                self.assertFalse(os.path.exists(self.outfile))
+
+    def test_unavailable_backend(self):
+        self.assertUsageError(
+            [
+                "--infile",
+                self.infile,
+                "--outfile",
+                self.outfile,
+                "--ecc",
+                "rs",
+                "--ecc-backend",
+                "bchlib",
+            ],
+            "ECC backend bchlib is not available for RS",
+        )
+        self.assertFalse(os.path.exists(self.outfile))
+
+    def test_ecc_cache_file(self):
+        cache_file = os.path.join(self.tmpdir.name, "ecc.sqlite")
+        args = [
+            "--infile",
+            self.infile,
+            "--outfile",
+            self.outfile,
+            "--ecc-cache-file",
+            cache_file,
+        ]
+
+        if "numpy" in available_backends():
+            self.assertUsageError(
+                [*args, "--ecc-backend", "numpy"],
+                "--ecc-cache-file is not used by the numpy batch encoder",
+            )
+            self.assertFalse(os.path.exists(cache_file))
+
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            main([*args, "--ecc-backend", "table", "--summary"])
+            main([*args, "--ecc-backend", "table", "--summary"])
+
+        # the repeated zero pages are only encoded once - their page has
+        # three identical chunks and a padded last chunk
+        self.assertIn("ECC cache: 2 hits, 2 misses", stderr.getvalue())
+        self.assertIn("ECC cache: 4 hits, 0 misses", stderr.getvalue())
+
+    def test_pad_too_small(self):
+        for extra in [[], ["--mmap"], ["--incremental"], ["--pipeline"]]:
+            with self.subTest(f"Testing {extra}"):
+                self.assertUsageError(
+                    [
+                        "--infile",
+                        self.infile,
+                        "--outfile",
+                        self.outfile,
+                        "--pad-to",
+                        "6K",
+                        *extra,
+                    ],
+                    "Input image larger than padded size",
+                )
+                self.assertFalse(os.path.exists(self.outfile))
+
+    def test_pad(self):
+        main(
+            [
+                "--infile",
+                self.infile,
+                "--outfile",
+                self.outfile,
+                "--pad-to",
+                "8K",
+            ]
+        )
+        self.assertEqual(os.path.getsize(self.outfile), 4 * 2112)
+
+        main(
+            [
+                "--infile",
+                self.infile,
+                "--outfile",
+                self.outfile,
+                "--pad-to",
+                "16K",
+            ]
+        )
+        self.assertEqual(os.path.getsize(self.outfile), 8 * 2112)
+
+    def test_incremental_pad(self):
+        args = [
+            "--infile",
+            self.infile,
+            "--outfile",
+            self.outfile,
+            "--incremental",
+            "--pad-to",
+            "16K",
+        ]
+
+        for _ in range(2):
+            main(args)
+            self.assertEqual(os.path.getsize(self.outfile), 8 * 2112)
+
+            with open(self.outfile, "rb") as out_file:
+                out_file.seek(4 * 2112)
+                self.assertEqual(out_file.read(), b"\xff" * 4 * 2112)
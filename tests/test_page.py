@@ -1,6 +1,12 @@
 # SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
 
+import concurrent.futures
+import itertools
+import os
+import re
+import sqlite3
+import tempfile
 from dataclasses import dataclass
 from unittest import TestCase
 
@@ -17,6 +23,41 @@ class TestConfig:
     widebus: bool = False  # TODO
 
 
+def resource_configs():
+    ecc_types = {
+        "rs": EccType.RS,
+        "sbl": EccType.RS_SBL,
+        "bch4": EccType.BCH4,
+        "bch8": EccType.BCH8,
+    }
+    pattern = re.compile(r"out-(\d+)-(\w+)_(\w+)-(\d+)oob\.bin")
+
+    for fname in sorted(os.listdir("tests/resources")):
+        match = pattern.fullmatch(fname)
+        if not match:
+            continue
+
+        yield TestConfig(
+            raw=match.group(2),
+            page=f"{match.group(2)}_{match.group(3)}",
+            page_size=int(match.group(1)),
+            oob_size=int(match.group(4)),
+            ecc=ecc_types[match.group(3)],
+        )
+
+
+def read_resources(config):
+    fname = f"in-{config.page_size}-{config.raw}.bin"
+    with open(f"tests/resources/{fname}", "rb") as in_file:
+        input_data = in_file.read()
+
+    fname = f"out-{config.page_size}-{config.page}-{config.oob_size}oob.bin"
+    with open(f"tests/resources/{fname}", "rb") as out_file:
+        output_data = out_file.read()
+
+    return input_data, output_data
+
+
 class ConfigTestCase(TestCase):
     def test_page(self):
         configs = [
@@ -642,6 +683,161 @@ def test_page(self):
 
                 self.assertEqual(page.data, output_data)
 
+    def test_page_many(self):
+        groups = {}
+        for config in resource_configs():
+            key = (config.page_size, config.oob_size, config.ecc)
+            groups.setdefault(key, []).append(read_resources(config))
+
+        for (page_size, oob_size, ecc), resources in groups.items():
+            with self.subTest(f"Testing {page_size}+{oob_size} {ecc}"):
+                page = Page(page_size=page_size, oob_size=oob_size, ecc=ecc)
+
+                # partial last page gets the same padding as in program()
+                tail = resources[-1][0][:100]
+                input_data = b"".join(r[0] for r in resources) + tail
+                output_data = b"".join(r[1] for r in resources)
+                output_data += page.program(tail)
+
+                self.assertEqual(page.program_many(input_data), output_data)
+
+    def test_page_threads(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            caches = [
+                {},
+                {"ecc_cache_size": 8},
+                {"ecc_cache_file": os.path.join(tmp, "ecc.sqlite")},
+            ]
+
+            for config, cache in itertools.product(resource_configs(), caches):
+                with self.subTest(f"Testing {config} {cache}"):
+                    input_data, output_data = read_resources(config)
+
+                    # a single page object shared by all threads
+                    with Page(
+                        page_size=config.page_size,
+                        oob_size=config.oob_size,
+                        ecc=config.ecc,
+                        **cache,
+                    ) as page:
+                        pages = [
+                            input_data[i : i + config.page_size]
+                            for i in range(
+                                0, len(input_data), config.page_size
+                            )
+                        ]
+                        with concurrent.futures.ThreadPoolExecutor(
+                            4
+                        ) as executor:
+                            results = list(
+                                executor.map(page.program, pages * 4)
+                            )
+
+                    self.assertEqual(b"".join(results), output_data * 4)
+
+    def test_page_stats(self):
+        calls = []
+
+        def stats_hook(stage, seconds, size):
+            self.assertGreaterEqual(seconds, 0)
+            calls.append((stage, size))
+
+        page = Page(
+            page_size=2048, oob_size=64, ecc=EccType.RS, stats_hook=stats_hook
+        )
+
+        # each chunk is encoded and copied in the page
+        page.program(os.urandom(2048))
+        self.assertEqual(calls, [("encode", 516), ("layout", 528)] * 4)
+
+        calls.clear()
+        page.program_many(os.urandom(2048 * 3))
+        stages = {stage for stage, _ in calls}
+        self.assertEqual(stages, {"encode", "layout"})
+
+    def test_page_into(self):
+        for config in resource_configs():
+            with self.subTest(f"Testing {config}"):
+                input_data, output_data = read_resources(config)
+
+                page = Page(
+                    page_size=config.page_size,
+                    oob_size=config.oob_size,
+                    widebus=config.widebus,
+                    ecc=config.ecc,
+                )
+
+                buffer = bytearray(b"\xaa" * (len(output_data) + 20))
+                page.program_into(memoryview(input_data), buffer, 10)
+
+                self.assertEqual(buffer[:10], b"\xaa" * 10)
+                self.assertEqual(buffer[10:-10], output_data)
+                self.assertEqual(buffer[-10:], b"\xaa" * 10)
+
+    def test_page_erased(self):
+        for config in resource_configs():
+            with self.subTest(f"Testing {config}"):
+                input_data, output_data = read_resources(config)
+                erased_data = b"\xff" * config.page_size
+                erased_page = b"\xff" * (config.page_size + config.oob_size)
+
+                page = Page(
+                    page_size=config.page_size,
+                    oob_size=config.oob_size,
+                    widebus=config.widebus,
+                    ecc=config.ecc,
+                    skip_erased=True,
+                )
+
+                self.assertEqual(page.program(erased_data), erased_page)
+                if input_data != erased_data:
+                    self.assertEqual(page.program(input_data), output_data)
+
+                # partial pages are padded with 0x00 and are not erased
+                self.assertNotEqual(page.program(erased_data[:1]), erased_page)
+
+                self.assertEqual(
+                    page.program_many(erased_data + input_data + erased_data),
+                    erased_page + page.program(input_data) + erased_page,
+                )
+
+    def test_page_unprogram(self):
+        for config in resource_configs():
+            with self.subTest(f"Testing {config}"):
+                input_data, output_data = read_resources(config)
+
+                page = Page(
+                    page_size=config.page_size,
+                    oob_size=config.oob_size,
+                    widebus=config.widebus,
+                    ecc=config.ecc,
+                )
+
+                self.assertEqual(page.unprogram(output_data), input_data)
+                self.assertEqual(
+                    page.unprogram_many(output_data * 3), input_data * 3
+                )
+
+    def test_page_close(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            with Page(ecc=EccType.RS, ecc_cache_file=path) as page:
+                page.program(os.urandom(2048))
+
+            # the cache file is no longer usable after close
+            self.assertRaises(
+                sqlite3.ProgrammingError, page.program, os.urandom(2048)
+            )
+
+    def test_page_too_large(self):
+        page = Page(page_size=2048, oob_size=64, ecc=EccType.RS)
+        buffer = bytearray(page.size)
+
+        self.assertRaises(ValueError, page.program, b"\x00" * 2049)
+        self.assertRaises(
+            ValueError, page.program_into, b"\x00" * 2049, buffer
+        )
+
     def test_page_raise(self):
         configs = [
             TestConfig(
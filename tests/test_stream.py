@@ -0,0 +1,69 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: Sven Eckelmann <sven@narfation.org>
+
+import io
+import random
+import shutil
+from unittest import TestCase
+
+from src.qcom_nandc_pagify import (
+    EccType,
+    PageConfig,
+    PagifyReader,
+    PagifyWriter,
+    iter_pages,
+    pagify,
+)
+from tests.helpers import random_bytes
+
+
+class StreamTestCase(TestCase):
+    def setUp(self):
+        rand = random.Random(1)
+
+        self.config = PageConfig(page_size=2048, oob_size=64, ecc=EccType.RS)
+        self.input_data = random_bytes(2048 * 20 + 100, rand)
+
+        data_out = io.BytesIO()
+        pagify(io.BytesIO(self.input_data), data_out, self.config)
+        self.expected = data_out.getvalue()
+
+        # blocks of varying size
+        self.blocks = []
+        pos = 0
+        while pos < len(self.input_data):
+            size = rand.randint(1, 5000)
+            self.blocks.append(self.input_data[pos : pos + size])
+            pos += size
+
+    def test_iter_pages(self):
+        pages = list(iter_pages(self.blocks, self.config, batch_pages=3))
+
+        self.assertEqual(len(pages), 21)
+        self.assertEqual(b"".join(pages), self.expected)
+        self.assertEqual(list(iter_pages([], self.config)), [])
+
+    def test_writer(self):
+        data_out = io.BytesIO()
+        with PagifyWriter(data_out, self.config, batch_pages=3) as writer:
+            for block in self.blocks:
+                self.assertEqual(writer.write(block), len(block))
+
+            writer.flush()
+            self.assertEqual(len(data_out.getvalue()) % 2112, 0)
+
+        self.assertEqual(data_out.getvalue(), self.expected)
+        self.assertEqual(writer.summary.pages, 21)
+        self.assertRaises(ValueError, writer.write, b"\x00")
+
+    def test_reader(self):
+        reader = PagifyReader(
+            io.BytesIO(self.input_data), self.config, batch_pages=3
+        )
+        buffered = io.BufferedReader(reader)
+
+        data_out = io.BytesIO()
+        shutil.copyfileobj(buffered, data_out, 1000)
+
+        self.assertEqual(data_out.getvalue(), self.expected)
+        self.assertEqual(reader.read(10), b"")